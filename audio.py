@@ -0,0 +1,207 @@
+import os
+import struct
+import threading
+import importlib.util
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Format tags found in the 'fmt ' chunk of a WAV file
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Only linear PCM and float samples can be memory-mapped, other WAV encodings (u-law,
+# A-law, ADPCM, ...) are decoded by soundfile like the compressed formats
+MAPPED_FORMATS = (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT)
+
+# Sample widths which can be memory-mapped directly, 24 bit samples are mapped as bytes
+PCM_DTYPES = {1: np.uint8, 2: np.int16, 3: np.uint8, 4: np.int32}
+FLOAT_DTYPES = {4: np.float32, 8: np.float64}
+
+# WAV files are read directly, the other formats need the optional soundfile package
+WAV_EXTENSIONS = ('.wav',)
+SOUNDFILE_EXTENSIONS = ('.flac', '.ogg', '.mp3')
+
+
+# Extensions of the audiofiles that can be opened on this machine
+def audio_extensions():
+    if importlib.util.find_spec('soundfile') is None:
+        return WAV_EXTENSIONS
+    return WAV_EXTENSIONS + SOUNDFILE_EXTENSIONS
+
+
+def read_audio_info(path):
+    if os.path.splitext(path)[1].lower() in WAV_EXTENSIONS:
+        info = read_wav_info(path)
+        if info['format'] in MAPPED_FORMATS:
+            return info
+        if importlib.util.find_spec('soundfile') is None:
+            raise ValueError("Unsupported WAV format " + hex(info['format']) + " in " + path + ", install soundfile to read it")
+    return read_soundfile_info(path)
+
+
+# Read only the RIFF headers of a WAV file, no sample data is touched
+def read_wav_info(path):
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(path + " is not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(path + " has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+
+            if chunk_id == b'fmt ':
+                chunk = f.read(size + (size & 1))
+                tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', chunk[:16])
+
+                # Extensible files keep the real format in the subformat GUID
+                if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                    tag = struct.unpack('<H', chunk[24:26])[0]
+                fmt = (tag, channels, rate, (bits + 7) // 8)
+
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(path + " has data before fmt chunk")
+                offset = f.tell()
+                break
+
+            # Skip chunks we do not care about (LIST, fact, ...), chunks are word aligned
+            else:
+                f.seek(size + (size & 1), 1)
+
+    tag, channels, rate, samp_width = fmt
+
+    # Writers that stream to disk sometimes leave the size field unset
+    size = min(size, os.path.getsize(path) - offset)
+    n_frames = size // (channels * samp_width)
+
+    return {'path' : path,
+            'format' : tag,
+            'f_rate' : rate,
+            'n_channels' : channels,
+            'samp_width' : samp_width,
+            'n_frames' : n_frames,
+            'offset' : offset,
+            'duration' : n_frames / rate}
+
+
+# Header of a file in any format soundfile reads, same keys as read_wav_info
+def read_soundfile_info(path):
+    import soundfile
+    info = soundfile.info(path)
+    return {'path' : path,
+            'format' : info.format,
+            'f_rate' : info.samplerate,
+            'n_channels' : info.channels,
+            'samp_width' : None,
+            'n_frames' : info.frames,
+            'offset' : None,
+            'duration' : info.frames / info.samplerate}
+
+
+# Samples of an audiofile as float32 mono in [-1, 1], whatever the format and channel
+# layout of the file. Slicing reads only the requested frames, channels are averaged
+class AudioSource:
+    dtype = np.dtype(np.float32)
+    ndim = 1
+
+    def __init__(self, info):
+        self.info = info
+        self.f_rate = info['f_rate']
+        self.channels = info['n_channels']
+
+    def __len__(self):
+        return self.info['n_frames']
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            raise TypeError("audio can only be read in contiguous slices")
+        start, stop, _ = index.indices(len(self))
+        if stop <= start:
+            return np.zeros(0, dtype=np.float32)
+
+        block = self.read(start, stop)
+        return block[:, 0] if self.channels == 1 else block.mean(axis=1)
+
+    # Frames of `size` samples starting every `hop` samples from `offset` on, as rows of
+    # an array. Frames running past the end are zero padded. Overlapping frames come from
+    # one read, frames further apart are read one by one so the gaps are never decoded
+    def frames(self, offset, hop, count, size):
+        out = np.zeros((count, size), dtype=np.float32)
+        if hop < size:
+            block = self[offset:offset + (count - 1) * hop + size]
+            full = min(count, max(0, (len(block) - size) // hop + 1))
+            if full > 0:
+                out[:full] = as_strided(block, shape=(full, size), strides=(hop * block.strides[0], block.strides[0]), writeable=False)
+            for j in range(full, count):
+                tail = block[j * hop:j * hop + size]
+                out[j, :len(tail)] = tail
+        else:
+            for j in range(count):
+                frame = self[offset + j * hop:offset + j * hop + size]
+                out[j, :len(frame)] = frame
+        return out
+
+
+# WAV data chunk opened as a memory-mapped array, pages are only read when sliced
+class WavSource(AudioSource):
+    def __init__(self, info):
+        super(WavSource, self).__init__(info)
+        width = info['samp_width']
+        dtypes = FLOAT_DTYPES if info['format'] == WAVE_FORMAT_IEEE_FLOAT else PCM_DTYPES
+        if width not in dtypes:
+            raise ValueError("Unsupported sample width of " + str(width) + " bytes in " + info['path'])
+
+        # Integer samples are scaled to [-1, 1], 8 bit samples are unsigned. The factor is
+        # a float32 so the samples stay float32, what the playback stream is opened with
+        self.width = width
+        self.zero = 128 if dtypes is PCM_DTYPES and width == 1 else 0
+        self.scale = None if dtypes is FLOAT_DTYPES else np.float32(1 / 2 ** (8 * (4 if width == 3 else width) - 1))
+
+        shape = (info['n_frames'], info['n_channels']) + ((3,) if width == 3 else ())
+        if info['n_frames'] == 0:
+            self.data = np.zeros(shape, dtype=dtypes[width])
+        else:
+            self.data = np.memmap(info['path'], dtype=dtypes[width], mode='r', offset=info['offset'], shape=shape)
+
+    def read(self, start, stop):
+        block = self.data[start:stop]
+
+        # 24 bit samples become the top three bytes of an int32, which keeps their sign
+        if self.width == 3:
+            wide = np.zeros(block.shape[:2] + (4,), dtype=np.uint8)
+            wide[..., 1:] = block
+            block = wide.view('<i4')[..., 0]
+
+        block = block.astype(np.float32)
+        if self.zero:
+            block -= self.zero
+        if self.scale is not None:
+            block *= self.scale
+        return block
+
+
+# Compressed formats are decoded by soundfile a slice at a time, long files are never
+# decoded as a whole. Reads seek, so they are serialized between threads
+class SoundFileSource(AudioSource):
+    def __init__(self, info):
+        import soundfile
+        super(SoundFileSource, self).__init__(info)
+        self.file = soundfile.SoundFile(info['path'])
+        self.lock = threading.Lock()
+
+    def read(self, start, stop):
+        with self.lock:
+            self.file.seek(start)
+            return self.file.read(stop - start, dtype='float32', always_2d=True)
+
+
+# Open an audiofile for reading, the format follows the header read by read_audio_info
+def open_signal(info):
+    if info['format'] in MAPPED_FORMATS and os.path.splitext(info['path'])[1].lower() in WAV_EXTENSIONS:
+        return WavSource(info)
+    return SoundFileSource(info)
@@ -0,0 +1,96 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from audio import open_signal
+
+# Analysis frame length and hop in seconds
+FRAME = 0.025
+HOP = 0.010
+
+# Frames analysed at a time, keeps memory bounded on memory-mapped files
+CHUNK_FRAMES = 4096
+
+# A frame is active when its energy is this far above the noise floor of the file, the
+# floor being the energy exceeded by 90% of the frames
+MARGIN_DB = 10
+FLOOR_PERCENTILE = 10
+
+# Frames that are quieter but cross zero often (fricatives, breath) count as active
+# when they are within ZCR_MARGIN_DB of the threshold
+ZCR_THRESHOLD = 0.25
+ZCR_MARGIN_DB = 6
+
+# Gaps shorter than this are bridged and shorter segments dropped, in seconds
+MIN_GAP = 0.2
+MIN_DURATION = 0.3
+
+# Proposals are computed in separate processes since the analysis is CPU bound
+WORKERS = os.cpu_count() or 1
+
+
+# RMS energy in dB below full scale and zero-crossing rate of every frame. Frames are
+# strided views on one read of the signal, CHUNK_FRAMES of them at a time
+def frame_features(signal, f_rate, frame=FRAME, hop=HOP):
+    length = max(1, int(frame * f_rate))
+    step = max(1, int(hop * f_rate))
+    n_frames = max(0, (len(signal) - length) // step + 1)
+
+    energy = np.empty(n_frames, dtype=np.float32)
+    zcr = np.empty(n_frames, dtype=np.float32)
+    for first in range(0, n_frames, CHUNK_FRAMES):
+        count = min(CHUNK_FRAMES, n_frames - first)
+        block = signal.frames(first * step, step, count, length)
+        block -= block.mean(axis=1, keepdims=True)
+
+        rms = np.sqrt(np.mean(block * block, axis=1))
+        energy[first:first + count] = 20 * np.log10(np.maximum(rms, 1e-10))
+        zcr[first:first + count] = np.count_nonzero(np.diff(np.signbit(block), axis=1), axis=1) / length
+
+    return energy, zcr
+
+
+# Candidate segments (start, stop) in seconds covering the non-silent parts of a signal
+def propose_segments(signal, f_rate, min_gap=MIN_GAP, min_duration=MIN_DURATION):
+    energy, zcr = frame_features(signal, f_rate)
+    if len(energy) == 0:
+        return []
+
+    threshold = np.percentile(energy, FLOOR_PERCENTILE) + MARGIN_DB
+    active = (energy > threshold) | ((energy > threshold - ZCR_MARGIN_DB) & (zcr > ZCR_THRESHOLD))
+
+    # Runs of active frames, as first frame and one past the last frame
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    first = np.nonzero(edges == 1)[0]
+    last = np.nonzero(edges == -1)[0]
+    if len(first) == 0:
+        return []
+
+    length = max(1, int(FRAME * f_rate)) / f_rate
+    step = max(1, int(HOP * f_rate)) / f_rate
+    starts = first * step
+    stops = (last - 1) * step + length
+
+    # Bridge short gaps, then drop short segments
+    keep = np.concatenate(([True], starts[1:] - stops[:-1] >= min_gap))
+    starts = starts[keep]
+    stops = np.append(stops[np.nonzero(keep)[0][1:] - 1], stops[-1])
+    long_enough = stops - starts >= min_duration
+
+    return [(round(start, 2), round(stop, 2)) for start, stop in zip(starts[long_enough].tolist(), stops[long_enough].tolist())]
+
+
+# Proposals for one file, runs in a worker process
+def propose_file(info):
+    return propose_segments(open_signal(info), info['f_rate'])
+
+
+# Yield (filename, proposals) for every file as soon as it is analysed. Workers are
+# spawned, forking the multithreaded GUI process could copy locks held by other threads
+def propose_all(filenames, workers=WORKERS):
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(propose_file, info) : file for file, info in filenames.items()}
+        for future in as_completed(futures):
+            try: yield futures[future], future.result()
+            except Exception as e: print(futures[future] + ": " + str(e))
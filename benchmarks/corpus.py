@@ -0,0 +1,116 @@
+import os
+import json
+import wave
+import numpy as np
+
+from project import SEGMENTATIONS_FILE, AUDIO_DIR, LABELS_FILE
+from segmentation_file import write_segmentations
+
+# Written next to the corpus, a corpus with the same parameters is reused
+CORPUS_FILE = "corpus.json"
+
+# Copy of the generated segmentation file, benchmarks edit and export the project and
+# restore it from this copy afterwards
+ORIGINAL_FILE = "segmentations.orig.parquet"
+
+LABELS = {"speech" : "#1f77b4", "music" : "#2ca02c", "noise" : "#ff7f0e", "failed" : "#d62728"}
+
+# Files are built from this much random audio, repeated from random offsets
+PATTERN_SECONDS = 10
+
+# Samples written at a time, long files are never held in memory
+WRITE_FRAMES = 1 << 20
+
+
+# Bursts of noise and quiet stretches, so peaks, spectrogram and proposals have structure
+def pattern(f_rate, rng):
+    n = PATTERN_SECONDS * f_rate
+    t = np.arange(n) / f_rate
+    gain = np.where(np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 2 * np.pi)) > 0, 0.5, 0.01)
+    return (rng.standard_normal(n) * gain * 8000).clip(-32768, 32767).astype('<i2')
+
+
+def write_audio(path, n_frames, f_rate, block, rng):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(f_rate)
+        written = 0
+        while written < n_frames:
+            count = min(WRITE_FRAMES, n_frames - written)
+            chunk = np.resize(np.roll(block, rng.integers(len(block))), count)
+            f.writeframes(chunk.tobytes())
+            written += count
+
+
+# Segments spread over the files, heavy_segments of them in the first file so that
+# per-file costs (table, spans, hit testing) are measured on a crowded file
+def segment_rows(durations, n_segments, heavy_segments, rng):
+    names = sorted(durations)
+    counts = np.zeros(len(names), dtype=int)
+    heavy = min(heavy_segments, n_segments)
+    counts[0] = heavy
+    if len(names) > 1:
+        counts[1:] = (n_segments - heavy) // (len(names) - 1)
+        counts[1:1 + (n_segments - heavy) % (len(names) - 1)] += 1
+    else:
+        counts[0] = n_segments
+
+    labels = list(LABELS)
+    filenames, seg_labels, starts, stops = [], [], [], []
+    for name, count in zip(names, counts):
+        duration = durations[name]
+        start = np.sort(rng.uniform(0, max(duration - 0.5, 0), count))
+        stop = np.minimum(start + rng.uniform(0.2, 2.0, count), duration)
+        filenames.extend([name] * count)
+        seg_labels.extend(labels[i % len(labels)] for i in rng.integers(len(labels), size=count))
+        starts.extend(np.round(start, 2).tolist())
+        stops.extend(np.round(stop, 2).tolist())
+    return filenames, seg_labels, starts, stops
+
+
+# Build a project in directory: audiofiles, labels.json and a segmentation file. Nothing
+# is written when the directory already holds a corpus with the same parameters
+def make_corpus(directory, n_files, min_minutes, max_minutes, n_segments, heavy_segments, f_rate, seed=0):
+    import pandas as pd
+    params = {'files' : n_files, 'min_minutes' : min_minutes, 'max_minutes' : max_minutes,
+              'segments' : n_segments, 'heavy_segments' : heavy_segments, 'f_rate' : f_rate, 'seed' : seed}
+    marker = os.path.join(directory, CORPUS_FILE)
+    original = os.path.join(directory, ORIGINAL_FILE)
+    try:
+        with open(marker) as f:
+            if json.load(f) == params and os.path.exists(original):
+                return params
+    except (IOError, ValueError): pass
+
+    # Nothing of an older corpus may survive a regeneration, the marker goes first so an
+    # interrupted generation is never reused
+    for path in (marker, original):
+        if os.path.exists(path):
+            os.remove(path)
+
+    rng = np.random.default_rng(seed)
+    audio = os.path.join(directory, AUDIO_DIR)
+    os.makedirs(audio, exist_ok=True)
+    for name in os.listdir(audio):
+        os.remove(os.path.join(audio, name))
+
+    block = pattern(f_rate, rng)
+    durations = {}
+    for i in range(n_files):
+        name = "file%06d.wav" % i
+        n_frames = int(rng.uniform(min_minutes, max_minutes) * 60 * f_rate)
+        write_audio(os.path.join(audio, name), n_frames, f_rate, block, rng)
+        durations[name] = n_frames / f_rate
+
+    with open(os.path.join(directory, LABELS_FILE), 'w') as f:
+        json.dump(LABELS, f)
+
+    filenames, labels, starts, stops = segment_rows(durations, n_segments, heavy_segments, rng)
+    df = pd.DataFrame({'filename' : filenames, 'label' : labels, 'start' : starts, 'stop' : stops})
+    write_segmentations(df, os.path.join(directory, SEGMENTATIONS_FILE))
+    write_segmentations(df, original)
+
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    return params
@@ -0,0 +1,237 @@
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import statistics
+
+# The GUI runs without a display, it must be set before Qt is imported
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import numpy as np
+
+from corpus import make_corpus, ORIGINAL_FILE
+from project import SEGMENTATIONS_FILE
+
+# Corpus sizes, every value can be overridden on the command line
+SCALES = {
+    'small' :  {'files' : 10,    'min_minutes' : 1, 'max_minutes' : 60, 'segments' : 10000},
+    'medium' : {'files' : 1000,  'min_minutes' : 1, 'max_minutes' : 5,  'segments' : 100000},
+    'large' :  {'files' : 10000, 'min_minutes' : 1, 'max_minutes' : 2,  'segments' : 1000000},
+}
+
+# Writing xlsx takes minutes beyond this many rows, larger exports skip it
+XLSX_MAX_ROWS = 100000
+
+# Fixed window size, draw times depend on it
+WINDOW_SIZE = (1600, 900)
+
+
+# Milliseconds per call of fn over repeat calls
+def measure(fn, repeat=1):
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        times.append(1000 * (time.perf_counter() - begin))
+    return summarize(times)
+
+
+def summarize(times):
+    return {'n' : len(times),
+            'mean_ms' : statistics.mean(times),
+            'median_ms' : statistics.median(times),
+            'min_ms' : min(times),
+            'max_ms' : max(times)}
+
+
+def wait_for(app, condition, timeout=3600):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise RuntimeError("Timed out")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+# Import, file switching, segment edits and click hit testing through the real Widget
+def gui_benchmarks(args, rng):
+    from PyQt5.QtWidgets import QApplication
+    from matplotlib.backend_bases import MouseEvent
+    import labeler
+
+    app = QApplication.instance() or QApplication([])
+    results = {}
+
+    widget = labeler.Widget(workers=args.workers, peak_workers=args.peak_workers)
+    widget.resize(*WINDOW_SIZE)
+    widget.show()
+    wait_for(app, lambda: hasattr(widget, 'canvas'))
+
+    # Import runs on a thread, measured until the first file is listed and until all are
+    begin = time.perf_counter()
+    widget.importData()
+    wait_for(app, lambda: widget.file_model.rowCount() > 0)
+    first = time.perf_counter()
+    wait_for(app, lambda: widget.scan_thread.isFinished())
+    app.processEvents()
+    results['importData'] = {'first_file_ms' : 1000 * (first - begin),
+                             'all_files_ms' : 1000 * (time.perf_counter() - begin),
+                             'files' : widget.file_model.rowCount()}
+
+    # Every switch opens the file and draws it. The first pass reads the audiofiles,
+    # the second finds them in the plot cache as long as they fit
+    n_switch = min(args.switches, widget.file_proxy.rowCount())
+    for name in ('itemActivated_cold', 'itemActivated_warm'):
+        times = []
+        for row in list(range(1, n_switch)) + [0]:
+            begin = time.perf_counter()
+            widget.samples_stored.selectRow(row)
+            times.append(1000 * (time.perf_counter() - begin))
+        results[name] = summarize(times)
+    widget.prefetch_pool.waitForDone()
+
+    # The first file of the corpus holds the most segments
+    heavy = min(widget.filenames)
+    widget.samples_stored.selectRow(next(row for row in range(widget.file_proxy.rowCount()) if widget.file_proxy.filename(row) == heavy))
+    duration = widget.filenames[widget.current_filename]['duration']
+    results['plotSignal'] = measure(widget.plotSignal, args.repeat)
+    results['segments_in_file'] = widget.segment_model.rowCount()
+    results['segments_in_project'] = len(widget.segments)
+
+    def onselect():
+        start = rng.uniform(0, max(duration - 1, 0))
+        widget.onselect(start, start + 0.5)
+    results['onselect'] = measure(onselect, args.repeat)
+
+    # The row is selected first, like a user picking the segment to delete
+    times = []
+    for _ in range(args.repeat):
+        widget.sample_segmentations.selectRow(int(rng.integers(widget.segment_model.rowCount())))
+        begin = time.perf_counter()
+        widget.delete()
+        times.append(1000 * (time.perf_counter() - begin))
+    results['delete'] = summarize(times)
+
+    # Clicks go through the matplotlib event handlers like a real left click
+    canvas = widget.canvas.fig.canvas
+    ax = widget.canvas.ax1
+    ax.set_xlim([0, duration])
+    canvas.draw()
+    intervals = widget.segments.segments(widget.current_filename)
+
+    def click():
+        x, y = ax.transData.transform((rng.uniform(0, duration), 0.5 * sum(ax.get_ylim())))
+        for name in ('button_press_event', 'button_release_event'):
+            canvas.callbacks.process(name, MouseEvent(name, canvas, x, y, button=1))
+    results['click'] = measure(click, args.repeat)
+    results['hits'] = measure(lambda: intervals.hits(rng.uniform(0, duration)), 100 * args.repeat)
+
+    results['exportData'] = measure(widget.exportData, 1)
+
+    widget.close()
+    widget.prefetch_pool.waitForDone()
+    return results
+
+
+# Writing and reading the segmentation file in every format
+def file_benchmarks(args):
+    from project import load_segmentations
+    from segmentation_file import FORMATS, read_segmentations, write_segmentations
+
+    results = {}
+    store = load_segmentations(SEGMENTATIONS_FILE)
+    results['load_segmentations'] = measure(lambda: load_segmentations(SEGMENTATIONS_FILE), 1)
+
+    df = store.to_dataframe()
+    for ext in FORMATS:
+        if ext == '.xlsx' and len(df) > XLSX_MAX_ROWS:
+            results[ext[1:]] = {'skipped' : "more than %d rows" % XLSX_MAX_ROWS}
+            continue
+        path = "benchmark" + ext
+        results[ext[1:]] = {'write' : measure(lambda: write_segmentations(df, path), 1),
+                            'read' : measure(lambda: read_segmentations(path), 1),
+                            'bytes' : os.path.getsize(path)}
+        os.remove(path)
+    return results
+
+
+def environment():
+    try: commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError): commit = None
+    return {'commit' : commit,
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'processor' : platform.processor(),
+            'cpus' : os.cpu_count(),
+            'numpy' : np.__version__,
+            'time' : time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time import, plotting, segment edits and export on a synthetic project")
+    parser.add_argument("--scale", choices=SCALES, default='small', help="corpus size (default: %(default)s)")
+    parser.add_argument("--files", type=int, help="number of audiofiles")
+    parser.add_argument("--min-minutes", type=float, help="shortest audiofile")
+    parser.add_argument("--max-minutes", type=float, help="longest audiofile")
+    parser.add_argument("--segments", type=int, help="segments in the project")
+    parser.add_argument("--heavy-segments", type=int, default=10000,
+                        help="segments in the first file, the one edits are timed on (default: %(default)s)")
+    parser.add_argument("--rate", type=int, default=16000, help="sample rate of the audiofiles (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated audio and segments (default: %(default)s)")
+    parser.add_argument("--corpus", default=os.path.join(REPO, '.benchmark'),
+                        help="folder the corpus is generated in and reused from (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions of the short operations (default: %(default)s)")
+    parser.add_argument("--switches", type=int, default=8, help="files stepped through when switching (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=8, help="threads reading headers on import (default: %(default)s)")
+    parser.add_argument("--peak-workers", type=int, default=0, help="processes computing peaks on import (default: %(default)s)")
+    parser.add_argument("--output", help="JSON file to write, printed when not given")
+    args = parser.parse_args(argv)
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        value = getattr(args, key)
+        if value is not None:
+            scale[key] = value
+
+    output = os.path.abspath(args.output) if args.output else None
+    # Every parameter is part of the name, a corpus is only reused for the same parameters
+    directory = os.path.join(args.corpus, "%d-%g-%g-%d-%d-%d-%d" % (scale['files'], scale['min_minutes'], scale['max_minutes'],
+                                                                  scale['segments'], args.heavy_segments, args.rate, args.seed))
+    os.makedirs(directory, exist_ok=True)
+    begin = time.perf_counter()
+    corpus = make_corpus(directory, scale['files'], scale['min_minutes'], scale['max_minutes'],
+                         scale['segments'], args.heavy_segments, args.rate, args.seed)
+    print("Corpus ready in %.1f s" % (time.perf_counter() - begin), file=sys.stderr)
+
+    # The labeler works on the current directory. Edits and caches of a previous run
+    # are removed, so every run starts from the generated segmentation file
+    os.chdir(directory)
+    shutil.rmtree('.labeler_cache', ignore_errors=True)
+    for name in os.listdir('.'):
+        if name.endswith('.journal'):
+            os.remove(name)
+    shutil.copy(ORIGINAL_FILE, SEGMENTATIONS_FILE)
+
+    rng = np.random.default_rng(0)
+    report = {'environment' : environment(), 'corpus' : corpus, 'gui' : gui_benchmarks(args, rng)}
+    shutil.copy(ORIGINAL_FILE, SEGMENTATIONS_FILE)
+    report['files'] = file_benchmarks(args)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
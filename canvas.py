@@ -0,0 +1,26 @@
+import inspect
+import matplotlib
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+from matplotlib.widgets import SpanSelector
+from matplotlib.collections import PolyCollection
+from matplotlib.backend_bases import MouseButton
+matplotlib.use('Qt5Agg')
+
+# Plotting is kept in its own module because importing matplotlib is the slowest part of
+# starting the labeler, it is imported once the window is on screen
+
+class MplCanvas(FigureCanvasQTAgg):
+    def __init__(self, parent=None, width=7, height=4, dpi=100):
+        self.fig = Figure(figsize=(9,3))
+        self.ax1 = self.fig.add_subplot(111)
+        super(MplCanvas, self).__init__(self.fig)
+
+
+# The selection rectangle is styled with props since matplotlib 3.5, rectprops is
+# deprecated there and removed in 3.7
+SPAN_PROPS = 'props' if 'props' in inspect.signature(SpanSelector).parameters else 'rectprops'
+
+def span_selector(ax, onselect, props, **kwargs):
+    kwargs[SPAN_PROPS] = props
+    return SpanSelector(ax, onselect, "horizontal", **kwargs)
@@ -0,0 +1,216 @@
+import os
+import sys
+import argparse
+
+from project import SEGMENTATIONS_FILE, AUDIO_DIR, load_labels, open_project, save_project
+from segmentation_file import FORMATS, segmentation_format, write_segmentations
+from segments import COLUMNS
+from merge import merge, annotator_names
+from scanner import scan_audio, WORKERS
+from peak_cache import PeakCache
+from project_index import ProjectIndex
+from autoseg import propose_all, WORKERS as PROPOSE_WORKERS
+from clips import CLIPS_DIR, CLIP_FORMATS, SHARD_SAMPLES, export_clips, WORKERS as CLIP_WORKERS
+
+# Headless entry point, runs without Qt and matplotlib so it can be used on servers
+# and in batch jobs. Everything works on the project in the current directory
+
+# Also run by `python labeler.py <command>`
+COMMANDS = ('scan', 'export', 'merge', 'autolabel', 'validate', 'clips')
+
+
+# Headers of all audiofiles by filename, read through the cache and project index shared
+# with the GUI. Only files that changed since the last scan are read
+def scan(workers=WORKERS, peak_workers=0, index=None):
+    cache = PeakCache()
+    try: return dict(scan_audio(os.path.join(os.getcwd(), AUDIO_DIR), workers, cache, peak_workers, index))
+    finally: cache.save()
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+# List the audiofiles, or only those with or without segments, from the project index
+def scan_command(args):
+    index = ProjectIndex()
+    files = scan(args.workers, args.peak_workers, index)
+    if args.unlabeled or args.label:
+        store, journal = open_project(args.segmentations)
+        journal.close()
+        index.sync_segments(store)
+        shown = index.unlabeled() if args.unlabeled else index.with_label(args.label)
+        files = {file : info for file, info in files.items() if file in shown}
+    index.close()
+
+    for file in sorted(files):
+        info = files[file]
+        print("%s\t%.2f\t%d\t%d" % (file, info['duration'], info['f_rate'], info['n_channels']))
+    print("%d files, %s" % (len(files), format_duration(sum(info['duration'] for info in files.values()))), file=sys.stderr)
+    return 0
+
+
+# Write the segments, journaled edits included, to another format or file
+def export_command(args):
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.segmentations)[0] + '.' + args.format if args.format else args.segmentations
+    segmentation_format(output)
+
+    store, journal = open_project(args.segmentations)
+    save_project(store, output, journal)
+    journal.close()
+    print("%d segments written to %s" % (len(store), output), file=sys.stderr)
+    return 0
+
+
+# Consolidate the segmentation files of several annotators, list where they disagree
+# and how well they agree
+def merge_command(args):
+    import pandas as pd
+    segmentation_format(args.output)
+    report = args.report or os.path.splitext(args.output)[0] + '.conflicts.csv'
+
+    segments, conflicts, agreement = merge(args.files, args.quorum)
+    write_segmentations(pd.DataFrame(segments, columns=COLUMNS), args.output)
+
+    names = annotator_names(args.files)
+    conflicts = pd.DataFrame(conflicts, columns=['filename', 'start', 'stop', 'kind'] + names)
+    conflicts[['start', 'stop']] = conflicts[['start', 'stop']].round(2)
+    conflicts.to_csv(report, index=False)
+
+    print("%d segments written to %s, %d conflicts to %s" % (len(segments), args.output, len(conflicts), report), file=sys.stderr)
+    for (a, b), pair in agreement['pairs'].items():
+        print("%s / %s: agreement %.1f%%, kappa %.3f" % (names[a], names[b], 100 * pair['agreement'], pair['kappa']), file=sys.stderr)
+    for label, share in agreement['labels'].items():
+        print("%s: %.1f%% of the time given by all" % (label, 100 * share), file=sys.stderr)
+    return 0
+
+
+# Propose segments for files without any and store them with a label
+def autolabel_command(args):
+    files = scan(args.workers)
+    store, journal = open_project(args.segmentations)
+    todo = {file : info for file, info in files.items() if args.all or len(store.segments(file)) == 0}
+
+    proposed = 0
+    for file, times in propose_all(todo, args.processes):
+        if len(times) == 0:
+            continue
+        store.extend(file, [args.label] * len(times), [start for start, stop in times], [stop for start, stop in times])
+        proposed += len(times)
+
+    save_project(store, args.segmentations, journal)
+    journal.close()
+    print("%d segments proposed in %d files" % (proposed, len(todo)), file=sys.stderr)
+    return 0
+
+
+# List segments which do not fit their audiofile or the labels, exits with 1 when there are any
+def validate_command(args):
+    labels = load_labels()
+    files = scan(args.workers)
+    store, journal = open_project(args.segmentations)
+    journal.close()
+
+    problems = 0
+    for file, label, start, stop in store.records():
+        if file not in files:
+            problem = "audiofile missing"
+        elif labels and label not in labels:
+            problem = "unknown label"
+        elif start < 0 or stop <= start:
+            problem = "empty or negative interval"
+        elif stop > files[file]['duration'] + 0.01:
+            problem = "ends after the audiofile"
+        else:
+            continue
+        problems += 1
+        print("%s\t%s\t%.2f\t%.2f\t%s" % (file, label, start, stop, problem))
+
+    print("%d segments checked, %d problems" % (len(store), problems), file=sys.stderr)
+    return 1 if problems > 0 else 0
+
+
+# Cut every segment out of its audiofile to build a dataset, skipping clips written before
+def clips_command(args):
+    files = scan(args.workers)
+    store, journal = open_project(args.segmentations)
+    journal.close()
+
+    missing = set(store.files) - set(files)
+    if missing:
+        print("%d files with segments are missing from %s, their segments are skipped" % (len(missing), AUDIO_DIR), file=sys.stderr)
+
+    written = sum(export_clips(store, files, args.output, args.format, args.processes, args.shard_samples))
+    print("%d clips written to %s" % (written, args.output), file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    project = argparse.ArgumentParser(add_help=False)
+    project.add_argument("--segmentations", default=SEGMENTATIONS_FILE,
+                         help="segmentation file of the project (default: %(default)s)")
+    scanning = argparse.ArgumentParser(add_help=False)
+    scanning.add_argument("--workers", type=int, default=WORKERS,
+                          help="threads reading audiofile headers (default: %(default)s)")
+
+    parser = argparse.ArgumentParser(prog="labeler", description="Work on the labeling project in the current directory without the GUI")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    command = commands.add_parser("scan", parents=[project, scanning], help="list the audiofiles and fill the header and peak cache")
+    command.add_argument("--peak-workers", type=int, default=0,
+                         help="processes computing waveform peaks of files missing from the cache (default: %(default)s)")
+    subset = command.add_mutually_exclusive_group()
+    subset.add_argument("--unlabeled", action="store_true", help="only list files without segments")
+    subset.add_argument("--label", help="only list files with segments of this label")
+    command.set_defaults(run=scan_command)
+
+    command = commands.add_parser("export", parents=[project], help="write the segments including unexported edits")
+    command.add_argument("--format", choices=[ext[1:] for ext in FORMATS],
+                         help="write next to the segmentation file in this format")
+    command.add_argument("--output", help="file to write, the format follows the extension")
+    command.set_defaults(run=export_command)
+
+    command = commands.add_parser("merge", help="consolidate the segmentation files of several annotators")
+    command.add_argument("files", nargs="+", help="segmentation files to merge, one per annotator")
+    command.add_argument("--output", required=True, help="merged file, the format follows the extension")
+    command.add_argument("--report", help="csv file listing where the annotators disagree (default: <output>.conflicts.csv)")
+    command.add_argument("--quorum", type=int,
+                         help="annotators that must give a label for it to be kept (default: a majority)")
+    command.set_defaults(run=merge_command)
+
+    command = commands.add_parser("autolabel", parents=[project, scanning], help="propose segments for unlabeled files")
+    command.add_argument("--label", required=True, help="label of the proposed segments")
+    command.add_argument("--all", action="store_true", help="also propose segments for files which have some")
+    command.add_argument("--processes", type=int, default=PROPOSE_WORKERS,
+                         help="processes analysing the audiofiles (default: %(default)s)")
+    command.set_defaults(run=autolabel_command)
+
+    command = commands.add_parser("validate", parents=[project, scanning], help="check the segments against the audiofiles and labels")
+    command.set_defaults(run=validate_command)
+
+    command = commands.add_parser("clips", parents=[project, scanning], help="cut the segments out of the audiofiles")
+    command.add_argument("--output", default=CLIPS_DIR, help="folder the clips are written to (default: %(default)s)")
+    command.add_argument("--format", choices=CLIP_FORMATS, default='wav',
+                         help="one WAV file per segment under <label>/, or NPZ shards (default: %(default)s)")
+    command.add_argument("--shard-samples", type=int, default=SHARD_SAMPLES,
+                         help="most samples in one NPZ shard (default: %(default)s)")
+    command.add_argument("--processes", type=int, default=CLIP_WORKERS,
+                         help="processes cutting the audiofiles (default: %(default)s)")
+    command.set_defaults(run=clips_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try: return args.run(args)
+    except ValueError as e: parser.error(str(e))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
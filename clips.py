@@ -0,0 +1,209 @@
+import os
+import glob
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from audio import open_signal, WAVE_FORMAT_IEEE_FLOAT
+
+# Clips are cut from the audiofiles into this folder of the working directory
+CLIPS_DIR = "clips"
+
+# One WAV file per segment, or the segments of consecutive audiofiles in NPZ shards of at
+# most SHARD_SAMPLES samples (float32, so 128 MB), a shard is built in memory
+CLIP_FORMATS = ('wav', 'npz')
+SHARD_SAMPLES = 1 << 25
+
+# Shards end before audiofiles whose name hashes to a multiple of this once they are half
+# full, so a file added or removed moves the boundaries of its own shard only
+SHARD_ANCHOR = 8
+
+# Lists every clip written with the segment it was cut from
+INDEX_FILE = "index.csv"
+
+# Cutting is CPU and disk bound, every audiofile is handled by one worker process
+WORKERS = os.cpu_count() or 1
+
+
+# Write float32 samples as a WAV file. Files are written under a temporary name and
+# renamed, so an interrupted export never leaves a partial clip that would be skipped
+def write_wav(path, samples, f_rate):
+    data = np.asarray(samples, dtype='<f4').tobytes()
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(struct.pack('<4sI4s', b'RIFF', 4 + 26 + 12 + 8 + len(data), b'WAVE'))
+        f.write(struct.pack('<4sIHHIIHHH', b'fmt ', 18, WAVE_FORMAT_IEEE_FLOAT, 1, f_rate, 4 * f_rate, 4, 32, 0))
+        f.write(struct.pack('<4sII', b'fact', 4, len(data) // 4))
+        f.write(struct.pack('<4sI', b'data', len(data)))
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# Clips are named after their audiofile and times in milliseconds, so a segment whose
+# times change gets a new clip instead of reusing the old one
+def clip_name(filename, label, start, stop):
+    label = str(label).replace(os.sep, '_')
+    return os.path.join(label, "%s_%d_%d.wav" % (os.path.splitext(filename)[0], round(start * 1000), round(stop * 1000)))
+
+
+# Samples of one segment, clipped to the audiofile. Empty when the segment lies outside it
+def cut(signal, f_rate, start, stop):
+    return signal[max(0, int(round(start * f_rate))):int(round(stop * f_rate))]
+
+
+# Write the segments of one audiofile as WAV files, runs in a worker process. The
+# audiofile is opened once and only the pages under the segments are read. Returns
+# the index rows of the clips and how many of them were written
+def cut_file(info, filename, segments, directory):
+    signal = None
+    rows, written = [], 0
+    for label, start, stop in segments:
+        name = clip_name(filename, label, start, stop)
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            if signal is None:
+                signal = open_signal(info)
+            samples = cut(signal, info['f_rate'], start, stop)
+            if len(samples) == 0:
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_wav(path, samples, info['f_rate'])
+            written += 1
+        rows.append((filename, label, start, stop, name, -1))
+    return rows, written
+
+
+# Length in samples of the clip of a segment, as cut() cuts it
+def clip_samples(info, start, stop):
+    return max(0, min(int(round(stop * info['f_rate'])), info['n_frames']) - max(0, int(round(start * info['f_rate']))))
+
+
+def key_hash(key):
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+# Split the segments of every audiofile into shards of at most shard_samples samples. A
+# file is split between shards only when its clips alone exceed the limit. Shards are
+# named after their first clip, so an unchanged shard keeps its name and is skipped
+def plan_shards(todo, files, shard_samples=SHARD_SAMPLES):
+    shards, current, size = [], [], 0
+    for filename, segments in todo:
+        lengths = [clip_samples(files[filename], start, stop) for label, start, stop in segments]
+        anchor = int(key_hash(filename)[:8], 16) % SHARD_ANCHOR == 0
+        if current and (size + sum(lengths) > shard_samples or (anchor and 2 * size >= shard_samples)):
+            shards.append(current)
+            current, size = [], 0
+
+        first = 0
+        for i, length in enumerate(lengths):
+            if size + length > shard_samples and size > 0:
+                if i > first:
+                    current.append((filename, segments[first:i]))
+                shards.append(current)
+                current, size, first = [], 0, i
+            size += length
+        current.append((filename, segments[first:]))
+    if current:
+        shards.append(current)
+
+    named = []
+    for shard in shards:
+        filename, segments = shard[0]
+        named.append(("shard-%s.npz" % key_hash("%s|%d" % (filename, round(segments[0][1] * 1000)))[:16], shard))
+    return named
+
+
+# Write the segments of several audiofiles to one NPZ shard, runs in a worker process.
+# The clips are concatenated in `samples` and clip i is samples[offsets[i]:offsets[i+1]].
+# The segments are stored alongside, a shard holding exactly the same segments is kept
+def cut_shard(infos, files, name, directory):
+    filenames, labels, starts, stops = [], [], [], []
+    for filename, segments in files:
+        for label, start, stop in segments:
+            filenames.append(filename)
+            labels.append(str(label))
+            starts.append(start)
+            stops.append(stop)
+
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        try:
+            with np.load(path) as shard:
+                if shard['filenames'].tolist() == filenames and shard['labels'].tolist() == labels and \
+                   shard['starts'].tolist() == starts and shard['stops'].tolist() == stops:
+                    return [(filename, label, start, stop, name, item) for item, (filename, label, start, stop)
+                            in enumerate(zip(filenames, labels, starts, stops))], 0
+        except (OSError, ValueError, KeyError): pass
+
+    clips, f_rates = [], []
+    for filename, segments in files:
+        signal = open_signal(infos[filename])
+        f_rate = infos[filename]['f_rate']
+        for label, start, stop in segments:
+            clips.append(cut(signal, f_rate, start, stop))
+            f_rates.append(f_rate)
+
+    offsets = np.zeros(len(clips) + 1, dtype=np.int64)
+    np.cumsum([len(clip) for clip in clips], out=offsets[1:])
+    samples = np.concatenate(clips) if clips else np.zeros(0, dtype=np.float32)
+
+    # np.savez appends .npz to names without it, the temporary name keeps the extension
+    tmp = path[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp, samples=samples, offsets=offsets, f_rates=np.array(f_rates, dtype=np.int32),
+             filenames=np.array(filenames, dtype=str), labels=np.array(labels, dtype=str),
+             starts=np.array(starts, dtype=float), stops=np.array(stops, dtype=float))
+    os.replace(tmp, path)
+    return [(filename, label, start, stop, name, item) for item, (filename, label, start, stop)
+            in enumerate(zip(filenames, labels, starts, stops))], len(clips)
+
+
+# Cut every segment of store out of its audiofile into directory and write the index.
+# Clips and shards already written are skipped, so an interrupted export picks up where
+# it stopped. Segments of audiofiles missing from files are left out. Yields the number
+# of clips written as every audiofile or shard is finished
+def export_clips(store, files, directory=CLIPS_DIR, clip_format='wav', workers=WORKERS, shard_samples=SHARD_SAMPLES):
+    if clip_format not in CLIP_FORMATS:
+        raise ValueError("Unknown clip format " + str(clip_format) + ", expected one of " + ", ".join(CLIP_FORMATS))
+    os.makedirs(directory, exist_ok=True)
+
+    todo = [(filename, list(store.segments(filename))) for filename in sorted(store.files) if filename in files]
+    todo = [(filename, segments) for filename, segments in todo if len(segments) > 0]
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        if clip_format == 'wav':
+            futures = {pool.submit(cut_file, files[filename], filename, segments, directory) : filename for filename, segments in todo}
+        else:
+            futures = {}
+            for name, shard in plan_shards(todo, files, shard_samples):
+                infos = {filename : files[filename] for filename, segments in shard}
+                futures[pool.submit(cut_shard, infos, shard, name, directory)] = name
+
+        for future in as_completed(futures):
+            try: result, written = future.result()
+            except Exception as e:
+                print(futures[future] + ": " + str(e))
+                continue
+            rows.extend(result)
+            yield written
+
+    # Shards of segments that changed or are gone would be left behind under their old
+    # names. Only removed once every shard is done, the temporary files of shards being
+    # written match the same pattern
+    if clip_format == 'npz':
+        names = set(futures.values())
+        for path in glob.glob(os.path.join(directory, "shard-*.npz")):
+            if os.path.basename(path) not in names:
+                os.remove(path)
+
+    write_index(rows, directory, clip_format)
+
+
+def write_index(rows, directory, clip_format):
+    import pandas as pd
+    columns = ['filename', 'label', 'start', 'stop', 'path' if clip_format == 'wav' else 'shard', 'item']
+    df = pd.DataFrame(rows, columns=columns).sort_values(columns[-2:] if clip_format == 'npz' else ['filename', 'start'], kind='mergesort')
+    if clip_format == 'wav':
+        df = df.drop(columns='item')
+    df.to_csv(os.path.join(directory, INDEX_FILE), index=False)
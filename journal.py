@@ -0,0 +1,139 @@
+import os
+import json
+from collections import Counter
+
+JOURNAL_FILE = 'segmentations.journal'
+
+# Records are fsync'd once this many are pending, the UI flushes the rest on a timer
+BATCH_SIZE = 50
+
+
+# Append-only log of segment additions and deletions made since the last export.
+# The first line names the segmentation file the log applies to and stamps its version
+class Journal:
+    def __init__(self, path=JOURNAL_FILE, base=None):
+        self.path = path
+        self.base = base
+        self.pending = []
+        self.file = None
+        # Where a journal that did not match its segmentation file was moved, see replay
+        self.stale = None
+
+    # Size and modification time of the segmentation file, None when it does not exist
+    def stamp(self):
+        try: stat = os.stat(self.base)
+        except (OSError, TypeError): return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    # Name of the segmentation file as written to the header. The journal lives next to it,
+    # so the name is enough and a copied project keeps its journal
+    def base_name(self):
+        return os.path.basename(self.base) if self.base is not None else None
+
+    # Apply the journal to a store loaded from the segmentation file and start appending.
+    # A journal written for another version of the file is only dropped when its edits are
+    # already in the file (a crash between writing the file and resetting the journal).
+    # Otherwise it is moved aside to self.stale, nothing is applied and nothing is lost
+    def replay(self, store):
+        self.stale = None
+        try:
+            with open(self.path, 'r') as journal_file:
+                header = json.loads(journal_file.readline())
+                records = []
+                valid = journal_file.tell()
+                for line in iter(journal_file.readline, ''):
+                    # A torn last line is what remains of a crash, everything before it is valid
+                    if not line.endswith('\n'):
+                        break
+                    try: records.append(json.loads(line))
+                    except ValueError: break
+                    valid = journal_file.tell()
+                torn = journal_file.tell() != valid
+        except (IOError, ValueError) as e:
+            if os.path.exists(self.path):
+                print(e)
+                if os.path.getsize(self.path) > 0:
+                    self.set_aside()
+            self.reset()
+            return 0
+
+        # Journals written before the header named the file match any name
+        matches = header.get('op') == 'base' and header.get('stamp') == self.stamp() and \
+            header.get('base', self.base_name()) == self.base_name()
+        if not matches:
+            if not contains(store, records):
+                print("journal does not match " + str(self.base) + ", its edits were not applied")
+                self.set_aside()
+            self.reset()
+            return 0
+
+        for record in records:
+            if record['op'] == 'add':
+                store.add(record['filename'], record['label'], record['start'], record['stop'])
+            elif record['op'] == 'delete':
+                store.discard(record['filename'], record['label'], record['start'], record['stop'])
+
+        # New records would be appended to the torn line and be lost with it
+        if torn:
+            os.truncate(self.path, valid)
+        self.file = open(self.path, 'a')
+        return len(records)
+
+    # Keep a journal that cannot be replayed as <journal>.stale, numbered when one is already there
+    def set_aside(self):
+        stale = self.path + '.stale'
+        n = 1
+        while os.path.exists(stale):
+            stale = "%s.stale.%d" % (self.path, n)
+            n += 1
+        os.replace(self.path, stale)
+        self.stale = stale
+
+    def add(self, filename, label, start, stop):
+        self.record('add', filename, label, start, stop)
+
+    def delete(self, filename, label, start, stop):
+        self.record('delete', filename, label, start, stop)
+
+    def record(self, op, filename, label, start, stop):
+        self.pending.append(json.dumps({'op' : op, 'filename' : filename, 'label' : label, 'start' : start, 'stop' : stop}))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.file is None or len(self.pending) == 0:
+            return
+        self.file.write('\n'.join(self.pending) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = []
+
+    # Start an empty journal on top of the current segmentation file, called after an export
+    def reset(self):
+        if self.file is not None:
+            self.file.close()
+        self.pending = []
+        self.file = open(self.path, 'w')
+        self.file.write(json.dumps({'op' : 'base', 'base' : self.base_name(), 'stamp' : self.stamp()}) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# Whether the edits of records are all in store: every segment they add in the end is
+# there and every segment they delete in the end is not
+def contains(store, records):
+    net = Counter()
+    for record in records:
+        key = record['filename'], record['label'], record['start'], record['stop']
+        net[key] += 1 if record['op'] == 'add' else -1 if record['op'] == 'delete' else 0
+    for (filename, label, start, stop), count in net.items():
+        present = store.segments(filename).find(label, start, stop) is not None
+        if count != 0 and present != (count > 0):
+            return False
+    return True
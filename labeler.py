@@ -1,40 +1,77 @@
-from PyQt5.QtWidgets import *
+import time
+
+# Startup phases are measured from here, see --profile-startup
+STARTUP_TIME = time.perf_counter()
+
+import sys
+
+# Subcommands run headless, Qt is not even imported
+if __name__ == "__main__":
+    import cli
+    if len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS:
+        sys.exit(cli.main(sys.argv[1:]))
+
+from PyQt5.QtWidgets import (QApplication, QDialog, QWidget, QGridLayout, QHBoxLayout, QVBoxLayout, QGroupBox,
+                             QPushButton, QCheckBox, QRadioButton, QLineEdit, QComboBox, QTableView, QHeaderView,
+                             QAbstractItemView, QScrollBar, QShortcut, QMessageBox)
 from PyQt5.QtGui import QKeySequence, QFont
-from PyQt5.QtCore import pyqtSignal, Qt, QThread, pyqtSlot
-
-import matplotlib
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
-from matplotlib.widgets import SpanSelector
-import matplotlib.animation as animation
-from matplotlib.backend_bases import MouseButton
-matplotlib.use('Qt5Agg')
-
-import json
-import matplotlib
+from PyQt5.QtCore import pyqtSignal, Qt, QThread, pyqtSlot, QObject, QRunnable, QThreadPool, QTimer, QItemSelectionModel
+
 import os
-import wave
-import time
+import argparse
+from collections import OrderedDict
 from sys import exit as sysExit
 import numpy as np
-import pandas as pd
-from pydub import AudioSegment
-from pydub.playback import play
 
+from audio import open_signal
+from peaks import envelope
+from spectrogram import SpectrogramCache, DB_FLOOR
+from peak_cache import PeakCache
+from segments import SegmentStore
+from segmentation_file import segmentation_format
+from project import SEGMENTATIONS_FILE, AUDIO_DIR, load_labels, load_segmentations, save_project, open_journal
+from scanner import scan_audio, WORKERS
+from project_index import ProjectIndex
+from playback import PlaybackEngine
+from autoseg import propose_segments, propose_all
+from models import FileListModel, FileFilterModel, SegmentTableModel
 
+IMPORT_TIME = time.perf_counter()
 
-class MplCanvas(FigureCanvasQTAgg):
-    def __init__(self, parent=None, width=7, height=4, dpi=100):
-        self.fig = Figure(figsize=(9,3))
-        self.ax1 = self.fig.add_subplot(111)
-        super(MplCanvas, self).__init__(self.fig)
+
+# Number of files whose signal and peaks are kept in memory
+PLOT_CACHE_SIZE = 8
+
+# Interval in ms at which pending journal records are written to disk
+JOURNAL_FLUSH_INTERVAL = 2000
+
+# Interval in ms at which the peak cache index is written, if anything changed
+CACHE_SAVE_INTERVAL = 30000
+
+# Scanned files are added to the list at most this often, in seconds
+SCAN_BATCH_INTERVAL = 0.25
+
+# Interval in ms at which the playhead is moved during playback
+PLAYHEAD_INTERVAL = 20
 
 class Widget(QDialog):
-    def __init__(self,parent=None):
+    # Raised on the playback thread, shown on the GUI thread
+    playback_error = pyqtSignal(str)
+
+    def __init__(self,parent=None,segmentations_file=SEGMENTATIONS_FILE,workers=WORKERS,peak_workers=0,profile_startup=False):
         super(Widget, self).__init__(parent)
+        self.segmentations_file = segmentations_file
+        self.workers = workers
+        self.peak_workers = peak_workers
+
+        # Set by the first import, a finished scan may be repeated while no file was found
+        self.scan_thread = None
+
+        # Times at which startup phases ended, only kept when profiling
+        self.startup = [('imports', IMPORT_TIME)] if profile_startup else None
        
-        # Initialize main sections of UI
-        self.createPlotArea()
+        # Initialize main sections of UI, the plot follows once the window is shown
+        self.canvas_placeholder = QWidget()
         self.createAudioControlArea()
         self.createSamplesArea()
         self.createImportExportArea()
@@ -43,7 +80,7 @@ class Widget(QDialog):
         
         # Place individual UI components in grid
         mainLayout = QGridLayout()
-        mainLayout.addWidget(self.canvas,1,0,1,4)
+        mainLayout.addWidget(self.canvas_placeholder,1,0,1,4)
         mainLayout.addWidget(self.audio_controls_layout,2,0,1,4)
         mainLayout.addWidget(self.samples_layout,3,0,8,1)
         mainLayout.addWidget(self.import_export_layout,3,2,1,2)
@@ -51,13 +88,36 @@ class Widget(QDialog):
         mainLayout.addWidget(self.labels_layout,5,2,1,2)
         self.setLayout(mainLayout)
 
-        # Build function which takes care of all the interaction 
-        self.buildDataFrame()
-        self.interactionListener()
-        self.sample_segmentations.currentCellChanged.connect(self.updatePlot)
+        self.buildSegmentStore()
+        self.sample_segmentations.selectionModel().currentRowChanged.connect(self.updatePlot)
+
+        # Nothing that draws can be used before the canvas is there
+        self.enablePlotControls(False)
+        self.markStartup('widgets')
+
+        # Runs as soon as the event loop starts, after the window is on screen
+        QTimer.singleShot(0, self.createPlotArea)
+
+    # Record the end of a startup phase when profiling
+    def markStartup(self, phase):
+        if self.startup is not None:
+            self.startup.append((phase, time.perf_counter()))
+
+    def reportStartup(self):
+        if self.startup is None:
+            return
+        phases = []
+        last = STARTUP_TIME
+        for phase, end in self.startup:
+            phases.append("%s %.0f ms" % (phase, 1000 * (end - last)))
+            last = end
+        print("Startup: " + ", ".join(phases) + ", total %.0f ms" % (1000 * (last - STARTUP_TIME)))
 
     # Initialize canvas where data is plotted
     def createPlotArea(self):
+        self.markStartup('window')
+        from canvas import MplCanvas, span_selector, PolyCollection
+
         self.canvas = MplCanvas(self)
         self.canvas.fig.tight_layout()
         self.canvas.fig.patch.set_facecolor('#ececeb')
@@ -68,7 +128,58 @@ class Widget(QDialog):
         
         for label in (self.canvas.ax1.get_xticklabels() + self.canvas.ax1.get_yticklabels()):
             label.set_fontsize(8)
+
+        # Waveform line is created once, file switches and zooming only replace its data
+        self.waveform, = self.canvas.ax1.plot([], [], 'k', lw = 0.9)
+
+        # The playhead is animated, full draws leave it out so the rendered waveform
+        # and spans can be cached and the playhead blitted on top of them
+        self.line = self.canvas.ax1.axvline(0, color = 'r', animated = True)
+        self.background = None
+        self.canvas.fig.canvas.mpl_connect('draw_event', self.onDraw)
+
+        # All segments of the current file are drawn as one collection, updated in place
+        self.segment_spans = PolyCollection([], transform = self.canvas.ax1.get_xaxis_transform(), edgecolors = 'k', alpha = 0.2)
+        self.canvas.ax1.add_collection(self.segment_spans)
+
+        # Proposed segments waiting to be accepted, drawn as outlines
+        self.times = []
+        self.proposals = {}
+        self.proposal_spans = PolyCollection([], transform = self.canvas.ax1.get_xaxis_transform(), facecolors = 'none', edgecolors = 'b', linestyles = '--')
+        self.canvas.ax1.add_collection(self.proposal_spans)
+
+        # Span selectors are created once and live as long as the canvas
+        self.audio_span = span_selector(self.canvas.ax1, self.on_audio_select, dict(alpha=0.2, facecolor="black"), minspan=0.02,useblit=True, button=3)
+        self.span = span_selector(self.canvas.ax1,self.onselect,dict(alpha=0.1),minspan=0.02,useblit=True, button=1)
+
+        # Spectrogram axes are created the first time the panel is shown
+        self.spectrogram = None
+        self.show_spectrogram = False
+        self.spectrogram_cache = SpectrogramCache()
+
+        # Drives the playhead during playback
+        self.playhead_timer = QTimer(self)
+        self.playhead_timer.timeout.connect(self.animate)
+
+        # Take the place of the placeholder and the color of the active label
+        self.layout().replaceWidget(self.canvas_placeholder, self.canvas)
+        self.canvas_placeholder.deleteLater()
+        self.setSpanColor()
+
+        # Build function which takes care of all the interaction 
+        self.interactionListener()
+        self.enablePlotControls(True)
+        self.markStartup('plot')
+        self.reportStartup()
         
+    # Controls whose handlers draw on the canvas. Buttons that are disabled on their
+    # own (pause, stop) stay disabled when their group is enabled
+    def enablePlotControls(self, enabled):
+        for group in (self.audio_controls_layout, self.import_export_layout, self.segmentation_tools_layout):
+            group.setEnabled(enabled)
+        for shortcut in self.plot_shortcuts:
+            shortcut.setEnabled(enabled)
+
     # Initialize audio control area where playing is controlled
     def createAudioControlArea(self):
  
@@ -76,16 +187,29 @@ class Widget(QDialog):
         self.audio_controls_layout = QGroupBox("Audio controls")
         
         # Widgets are added in a horizontal direction
-        layout = QVBoxLayout()
+        layout = QHBoxLayout()
 
         # Build play audio button
         self.btn_play_audio = QPushButton("Play audio")
+        self.btn_pause_audio = QPushButton("Pause")
+        self.btn_stop_audio = QPushButton("Stop")
+        self.btn_pause_audio.setEnabled(False)
+        self.btn_stop_audio.setEnabled(False)
+
+        # Shows a spectrogram under the waveform
+        self.cb_spectrogram = QCheckBox("Spectrogram")
 
         # Add buttons to layout
-        layout.addWidget(self.btn_play_audio)
+        layout.addWidget(self.btn_play_audio, stretch=2)
+        layout.addWidget(self.btn_pause_audio, stretch=1)
+        layout.addWidget(self.btn_stop_audio, stretch=1)
+        layout.addWidget(self.cb_spectrogram)
  
         # Add listeners to audio controls
         self.btn_play_audio.clicked.connect(self.playAudio)
+        self.btn_pause_audio.clicked.connect(self.pauseAudio)
+        self.btn_stop_audio.clicked.connect(self.stopAudio)
+        self.cb_spectrogram.toggled.connect(self.toggleSpectrogram)
       
         # Set layout
         self.audio_controls_layout.setLayout(layout) 
@@ -101,13 +225,31 @@ class Widget(QDialog):
         
         # Use self so that ListWidgets can be modified afterwards
         #self.samples_stored = QListWidget()
-        self.samples_stored = QTableWidget()
-        self.sample_segmentations = QTableWidget()
+        self.samples_stored = QTableView()
+        self.sample_segmentations = QTableView()
+
+        # Views read from models, no item is created per cell
+        self.file_model = FileListModel(self)
+        self.file_proxy = FileFilterModel(self)
+        self.file_proxy.setSourceModel(self.file_model)
+        self.segment_model = SegmentTableModel(self)
+        self.samples_stored.setModel(self.file_proxy)
+        self.sample_segmentations.setModel(self.segment_model)
+
+        # Filters the filenames while typing
+        self.file_filter = QLineEdit()
+        self.file_filter.setPlaceholderText("Filter filenames")
+        self.file_filter.textChanged.connect(self.file_proxy.setFilterText)
+        self.file_proxy.filterChanged.connect(self.restoreCurrentFile)
+
+        # Narrows the list to files with or without segments, answered by the project index
+        self.file_subset = QComboBox()
+        self.file_subset.addItems(["All files", "Unlabeled files", "Labeled files"] +
+                                  ["Files with " + label for label in load_labels()])
+        self.file_subset.currentIndexChanged.connect(self.filterFiles)
         
         # Set samples settings
-        self.samples_stored.setColumnCount(1)
         self.samples_stored.setFont(QFont('Arial',12))
-        self.samples_stored.setHorizontalHeaderLabels(['Filenames'])
         
         self.samples_stored.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.samples_stored.setSelectionBehavior(QTableView.SelectRows)
@@ -115,11 +257,10 @@ class Widget(QDialog):
         self.samples_stored.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.samples_stored.setSelectionMode(QAbstractItemView.SingleSelection)
         self.samples_stored.setSortingEnabled(True)
+        self.samples_stored.sortByColumn(0, Qt.AscendingOrder)
 
         # Set segmentations settings
-        self.sample_segmentations.setColumnCount(3)
         self.sample_segmentations.setFont(QFont('Arial', 12))
-        self.sample_segmentations.setHorizontalHeaderLabels(['Label','Start [s]','Stop [s]'])
         self.sample_segmentations.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.sample_segmentations.setSelectionBehavior(QTableView.SelectRows)
         self.sample_segmentations.horizontalHeader().setStretchLastSection(True) 
@@ -133,20 +274,26 @@ class Widget(QDialog):
         # Add scrollbars
         self.samples_stored.setVerticalScrollBar(scroll_bar_samples_stored)
         self.sample_segmentations.setVerticalScrollBar(scroll_bar_sample_segmentations)
+
+        # Rows have a fixed height so long lists are not measured row by row
+        for view in (self.samples_stored, self.sample_segmentations):
+            view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         
+        # Filters sit on top of the filenames
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(self.file_filter, stretch=1)
+        filter_layout.addWidget(self.file_subset)
+        files_layout = QVBoxLayout()
+        files_layout.addLayout(filter_layout)
+        files_layout.addWidget(self.samples_stored)
+
         # Add each widget to the horizontal layout
-        layout.addWidget(self.samples_stored, stretch=1)
+        layout.addLayout(files_layout, stretch=1)
         layout.addWidget(self.sample_segmentations, stretch=1)
         
         # Set layout
         self.samples_layout.setLayout(layout)
 
-    def getLabels(self):
-        try: 
-            with open(os.getcwd() + '/labels.json', 'r') as json_file:
-                return json.load(json_file)
-        except IOError: return {}
-
     # Initialize area where labels are placed
     def createLabelsArea(self):
         
@@ -158,7 +305,7 @@ class Widget(QDialog):
 
         # Read settings file and build labels accordinly
         self.labels={}
-        for idx, (label, color) in enumerate(self.getLabels().items()):
+        for idx, (label, color) in enumerate(load_labels().items()):
             
             # Build a random color and add to dictionary
             self.labels.update({label : color})
@@ -193,6 +340,13 @@ class Widget(QDialog):
         # Get the label of the checked button
         if rbtn.isChecked() == True:
             self.active_label = rbtn.text()
+            self.setSpanColor()
+
+    # Selection rectangle of the span selector takes the color of the label
+    def setSpanColor(self):
+        if hasattr(self, 'span'):
+            rect = getattr(self.span, '_selection_artist', None) or self.span.rect
+            rect.set_facecolor(self.labels[self.active_label])
 
     # Initialize area where dict is imported & exported
     def createImportExportArea(self):
@@ -231,16 +385,22 @@ class Widget(QDialog):
         self.btn_accept = QPushButton("Accept")
         self.btn_delete = QPushButton("Delete")
         self.btn_failed = QPushButton("Failed Sample")
+        self.btn_propose = QPushButton("Propose")
+        self.btn_propose_all = QPushButton("Propose all")
 
         # Add button to layout
         layout.addWidget(self.btn_accept)
         layout.addWidget(self.btn_delete)
         layout.addWidget(self.btn_failed)
+        layout.addWidget(self.btn_propose)
+        layout.addWidget(self.btn_propose_all)
 
         # Add listeners
         self.btn_accept.clicked.connect(self.accept)
         self.btn_delete.clicked.connect(self.delete)
         self.btn_failed.clicked.connect(self.failed)
+        self.btn_propose.clicked.connect(self.propose)
+        self.btn_propose_all.clicked.connect(self.proposeAll)
 
         # Set layout
         self.segmentation_tools_layout.setLayout(layout)
@@ -254,6 +414,12 @@ class Widget(QDialog):
         
         shortcut_failed = QShortcut(QKeySequence("f"),self)
         shortcut_failed.activated.connect(self.failed)
+
+        shortcut_propose = QShortcut(QKeySequence("p"),self)
+        shortcut_propose.activated.connect(self.propose)
+
+        # These draw on the canvas, see enablePlotControls
+        self.plot_shortcuts = [shortcut_delete, shortcut_accept, shortcut_failed, shortcut_propose]
                 
         # Add shortcut for label based on number
         up = QShortcut(QKeySequence("w"),self)
@@ -264,41 +430,24 @@ class Widget(QDialog):
 
            
     def up(self):
-        self.samples_stored.selectRow(self.samples_stored.currentRow()-1)
+        self.samples_stored.selectRow(self.samples_stored.currentIndex().row()-1)
         
     def down(self):
-        self.samples_stored.selectRow(self.samples_stored.currentRow()+1)
+        self.samples_stored.selectRow(self.samples_stored.currentIndex().row()+1)
         
     # Mark sample as failed
     def failed(self):
         
         start = 0
-        stop = self.filenames[self.current_filename]['time'][-1]
+        stop = self.filenames[self.current_filename]['duration']
             
-        # Update dataframe
-        self.df.loc[len(self.df)] = [self.current_filename, "failed", start, stop]
-        self.df = self.df.sort_values(['filename', 'start'], ascending=True)
-        self.df = self.df.reset_index(drop=True)
-        
-        # Get the right location to place row
-        subframe = self.df[self.df.filename == self.current_filename]
-        subframe = subframe.reset_index(drop = True)
-        idx = subframe[(subframe.start == start) & (subframe.stop == stop)].index[0]
-        
-        # Add to table
-        time_start = QTableWidgetItem(str(start)) 
-        time_start.setTextAlignment(Qt.AlignCenter)
-
-        time_end = QTableWidgetItem(str(stop))
-        time_end.setTextAlignment(Qt.AlignCenter)
-
-        self.sample_segmentations.insertRow(idx)
-        self.sample_segmentations.setItem(idx, 0, QTableWidgetItem("failed"))
-        self.sample_segmentations.setItem(idx, 1, time_start)
-        self.sample_segmentations.setItem(idx, 2, time_end)
+        # Update segment store and table
+        self.segment_model.add("failed", start, stop)
+        self.journal.add(self.current_filename, "failed", start, stop)
+        self.updateIndex()
 
         # Update plot
-        self.segmentation_span.insert(idx,self.canvas.ax1.axvspan(start, stop, facecolor=self.labels["failed"], ec = 'k',  alpha=0.2))
+        self.updateSpans()
         
         self.canvas.fig.canvas.draw()
 
@@ -309,163 +458,222 @@ class Widget(QDialog):
             self.area_selector.remove()
         
             # Get the current row number
-            row = self.sample_segmentations.currentRow()
+            row = self.sample_segmentations.currentIndex().row()
             
-            # Remove selected row based on number
-            self.sample_segmentations.removeRow(row)
-            act_item = self.segmentation_span.pop(row)
-            act_item.remove()
+            # Delete from segment store and table, rows match the order of the store
+            label, start, stop = self.segment_model.remove(row)
+            self.journal.delete(self.current_filename, label, start, stop)
+            self.updateIndex()
 
             # Redraw plot
+            self.updateSpans()
             self.canvas.fig.canvas.draw()
-
-            # Delete underlying dataframe
-            subframe = self.df[self.df.filename == self.current_filename]
-            idx = self.df[self.df.filename == self.current_filename].index[row]
-            self.df = self.df.drop(idx)
-            self.df = self.df.reset_index(drop=True)
             
         except Exception as e: print(e)
         
 
         
+    # Add all proposed segments with the active label in one store update and one redraw
     def accept(self):
+        if len(self.times) == 0:
+            return
+
+        starts = [round(start,2) for start, stop in self.times]
+        stops = [round(stop,2) for start, stop in self.times]
+        labels = [self.active_label] * len(starts)
+
+        # Update segment store and table
+        self.segment_model.extend(labels, starts, stops)
+        for start, stop in zip(starts, stops):
+            self.journal.add(self.current_filename, self.active_label, start, stop)
+        self.updateIndex()
+
+        # Accepted proposals are no longer shown as such
+        self.times = []
+        self.proposals.pop(self.current_filename, None)
         
-        for start, stop in self.times:
-            start = round(start,2)
-            stop = round(stop,2)
-    
-            # Update dataframe
-            self.df.loc[len(self.df)] = [self.current_filename, self.active_label, start, stop]
-            self.df = self.df.sort_values(['filename', 'start'], ascending=True)
-            self.df = self.df.reset_index(drop=True)
-            
-            # Get the right location to place row
-            subframe = self.df[self.df.filename == self.current_filename]
-            subframe = subframe.reset_index(drop = True)
-            idx = subframe[(subframe.start == start) & (subframe.stop == stop)].index[0]
-            
-            # Add to table
-            time_start = QTableWidgetItem(str(start)) 
-            time_start.setTextAlignment(Qt.AlignCenter)
-    
-            time_end = QTableWidgetItem(str(stop))
-            time_end.setTextAlignment(Qt.AlignCenter)
-    
-            self.sample_segmentations.insertRow(idx)
-            self.sample_segmentations.setItem(idx, 0, QTableWidgetItem(self.active_label))
-            self.sample_segmentations.setItem(idx, 1, time_start)
-            self.sample_segmentations.setItem(idx, 2, time_end)
-    
-            # Update plot
-            self.segmentation_span.insert(idx,self.canvas.ax1.axvspan(start, stop, facecolor=self.labels[self.active_label], ec = 'k',  alpha=0.2))
-        
+        self.updateSpans()
+        self.updateProposals()
         self.canvas.fig.canvas.draw()
+
+    # Propose the non-silent parts of the current file as segments, accept adds them
+    def propose(self):
+        if not hasattr(self, 'current_filename'):
+            return
+        info = self.filenames[self.current_filename]
+        self.times = propose_segments(self.getSignal(self.current_filename), info['f_rate'])
+        self.proposals[self.current_filename] = self.times
+        self.updateProposals()
+        self.canvas.fig.canvas.draw_idle()
+
+    # Propose segments for every imported file on a process pool, in the background
+    def proposeAll(self):
+        if not hasattr(self, 'filenames') or getattr(self, 'propose_thread', None) is not None:
+            return
+        self.btn_propose_all.setEnabled(False)
+        # Owned by the widget and deleted by Qt once it has finished, dropping the
+        # Python reference never destroys a running thread
+        self.propose_thread = ProposeThread(dict(self.filenames), self)
+        self.propose_thread.proposed.connect(self.onProposed)
+        self.propose_thread.finished.connect(self.onProposeFinished)
+        self.propose_thread.finished.connect(self.propose_thread.deleteLater)
+        self.propose_thread.start()
+
+    def onProposed(self, filename, times):
+        self.proposals[filename] = times
+        if filename == getattr(self, 'current_filename', None):
+            self.times = times
+            self.updateProposals()
+            self.canvas.fig.canvas.draw_idle()
+
+    def onProposeFinished(self):
+        self.propose_thread = None
+        self.btn_propose_all.setEnabled(True)
         
     # Function connected to import button
     def importData(self):
 
         # Make sure that user cannot import records many times
-        if self.samples_stored.rowCount() == 0:
+        if self.file_model.rowCount() > 0 or not (self.scan_thread is None or self.scan_thread.isFinished()):
+            return
+
+        # Caches, journal and listeners are set up once, later imports only scan again
+        if self.scan_thread is None:
             
-            # Initialize list where spans are added
-            self.segmentation_span = []
             self.filenames = {}
-            
-            # Build a counter for number of samples
-            idx = 0
-
-            # Load audiofiles
-            for r, d, f in os.walk(os.getcwd() + '/audiofiles/'):
-                for file in f:
-                    if file.endswith(".wav"):
-                            
-                        # Read time & signal into memory
-                        raw = wave.open(os.getcwd() + '/audiofiles/' + file)            
-                        f_rate = raw.getframerate()
-                        signal = raw.readframes(-1)
-                        signal = np.frombuffer(signal, dtype ="int16")
-                        time = np.linspace(0,len(signal) / f_rate,num = len(signal))
-                        self.filenames.update({file : {'signal' : signal, 'time' : time, 'f_rate' : f_rate}})
-                        #self.samples_stored.addItem(file)
-                                 
-                        self.samples_stored.insertRow(idx)
-                        self.samples_stored.setItem(idx, 0, QTableWidgetItem(file))
+            self.peak_cache = PeakCache()
+            self.project_index = ProjectIndex()
+
+            # Neighbouring files are loaded in the background while labeling
+            self.prefetch_pool = QThreadPool()
+            self.prefetch_pool.setMaxThreadCount(2)
            
+            # Only the signal of the current file is kept mapped
+            self.plot_cache = OrderedDict()
+            self.prefetching = set()
+
             # Try to read stored segmentations
-            try: self.df = pd.read_excel("segmentations.xlsx")
-            except: pass
-            
-            self.samples_stored.sortItems(0)
+            try: self.segments = load_segmentations(self.segmentations_file)
+            except Exception as e: print(e)
+
+            # Apply the edits which were not exported yet, then keep journaling new ones
+            self.journal = open_journal(self.segmentations_file)
+            self.journal.replay(self.segments)
+            if self.journal.stale is not None:
+                QMessageBox.warning(self, "Journal", "The journal does not match " + self.segmentations_file +
+                                    ", its unexported edits were not applied and are kept in " + self.journal.stale)
+            self.project_index.sync_segments(self.segments)
+            self.journal_timer = QTimer(self)
+            self.journal_timer.timeout.connect(self.journal.flush)
+            self.journal_timer.start(JOURNAL_FLUSH_INTERVAL)
+
+            # Peaks built while labeling are indexed in batches, not on every file
+            self.cache_timer = QTimer(self)
+            self.cache_timer.timeout.connect(self.peak_cache.save_async)
+            self.cache_timer.start(CACHE_SAVE_INTERVAL)
 
             # Add a listener for when the current item is changed
-            self.samples_stored.currentCellChanged.connect(self.itemActivated)
-        
-            # Select first item in list
+            self.samples_stored.selectionModel().currentRowChanged.connect(self.itemActivated)
+
+        # Headers are read on a pool, files show up in the list while the scan runs
+        self.scan_thread = ScanThread(os.path.join(os.getcwd(), AUDIO_DIR), self.workers, self.peak_cache, self.peak_workers,
+                                      self.project_index)
+        self.scan_thread.scanned.connect(self.onScanned)
+        self.scan_thread.finished.connect(self.peak_cache.save_async)
+        self.scan_thread.start()
+
+    # A filter that hid the current file and shows it again leaves the view without a
+    # current row, the file is selected again where it is shown now
+    def restoreCurrentFile(self):
+        filename = getattr(self, 'current_filename', None)
+        if filename is None or self.samples_stored.currentIndex().isValid():
+            return
+        index = self.file_proxy.indexOf(filename)
+        if index.isValid():
+            self.samples_stored.selectionModel().setCurrentIndex(index, QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows)
+            self.samples_stored.scrollTo(index)
+
+    # Add a batch of scanned files to the list
+    def onScanned(self, batch):
+
+        # One insert per batch, the proxy puts the new rows in sorted order
+        self.filenames.update(batch)
+        self.file_model.addFiles([file for file, info in batch])
+
+        # Select first item in list as soon as there is one
+        if not self.samples_stored.currentIndex().isValid():
             self.samples_stored.selectRow(0)
             
+    # Label counts of the current file follow every edit, so the filters stay correct
+    def updateIndex(self):
+        self.project_index.set_segments(self.current_filename, self.segments.segments(self.current_filename))
+
+    # Show all files, files with or without segments or files with a label. The list is
+    # only narrowed when the choice changes, files do not vanish while they are labeled.
+    # Unlabeled files are those not labeled, so files still being scanned are included
+    def filterFiles(self, choice):
+        if choice == 0 or not hasattr(self, 'project_index'):
+            self.file_proxy.setFilterFiles(None)
+        elif choice <= 2:
+            self.file_proxy.setFilterFiles(self.project_index.labeled(), exclude=choice == 1)
+        else:
+            self.file_proxy.setFilterFiles(self.project_index.with_label(self.file_subset.itemText(choice)[len("Files with "):]))
+
     # Function connected to export button
     def exportData(self):
         # If you want to hinder user from having multiple different labels
         #df.groupby('record_id')['label'].nunique().max()
-        self.df.to_excel("segmentations.xlsx", index=False)
+        # Everything journaled so far becomes part of the segmentation file
+        save_project(self.segments, self.segmentations_file, getattr(self, 'journal', None))
 
     # Function connected to when list item changes in samples_stored
-    def itemActivated(self, item):
+    def itemActivated(self, current, previous=None):
+
+        # Rows move while the list is sorted during the scan, the file itself did not change.
+        # Nothing is current when the filter hides the file
+        if not current.isValid() or current.data() == getattr(self, 'current_filename', None):
+            return
 
         # Current filename
-        self.current_filename = self.samples_stored.currentItem().text()
+        self.current_filename = current.data()
 
         # Initially zero so that audio is played from start to stop
-        self.start_audio = self.filenames[self.current_filename]['time'][0]
-        self.stop_audio = self.filenames[self.current_filename]['time'][-1]
+        self.start_audio = 0
+        self.stop_audio = self.filenames[self.current_filename]['duration']
 
-        # Delete previous spans
-        self.segmentation_span.clear()
+        # Delete previous selections
+        try: self.area_selector.remove()
+        except: pass
+
+        try: self.audio_selector_span.remove()
+        except: pass
 
         # Plot data
         try: self.plotSignal()
         except: pass
 
         # Move vertical line to right location
-        try: self.line.remove()
-        except: pass
-
-        self.line = self.canvas.ax1.axvline(self.start_audio, color = 'r')
-        
-        # Clear widget containing previous segmentations (row texts)
-        self.sample_segmentations.setRowCount(0)
+        self.line.set_xdata([self.start_audio, self.start_audio])
         
-        # Update segmentation table
-        subframe = self.df[self.df.filename == self.current_filename]
-        if len(subframe) > 0:
-            for idx, (_, row) in enumerate(subframe.iterrows()):
-        
-                # Add to table
-                time_start = QTableWidgetItem(str(round(row['start'],2))) 
-                time_start.setTextAlignment(Qt.AlignCenter)
-
-                time_end = QTableWidgetItem(str(round(row['stop'],2)))
-                time_end.setTextAlignment(Qt.AlignCenter)
+        # Segmentation table shows the segments of the new file
+        self.segment_model.setFile(self.segments, self.current_filename)
 
-                self.sample_segmentations.insertRow(idx)
-                self.sample_segmentations.setItem(idx, 0, QTableWidgetItem(row['label']))
-                self.sample_segmentations.setItem(idx, 1, time_start)
-                self.sample_segmentations.setItem(idx, 2, time_end)
-                
-                self.segmentation_span.append(self.canvas.ax1.axvspan(row['start'], row['stop'],facecolor=self.labels[row['label']], ec='k',alpha = 0.2))
-       
-        # Initialize right button span selector
-        self.audio_span = SpanSelector(self.canvas.ax1, self.on_audio_select, "horizontal", minspan=0.02,useblit=True,rectprops=dict(alpha=0.2, facecolor="black"), button=3)
-
-        # Initialize span selector which allows area selections to be made
-        self.span = SpanSelector(self.canvas.ax1,self.onselect,"horizontal",minspan=0.02,useblit=True,rectprops=dict(alpha=0.1, facecolor=self.labels[self.active_label]), button=1)
+        # Replace the spans and proposals of the previous file
+        self.times = self.proposals.get(self.current_filename, [])
+        self.updateSpans()
+        self.updateProposals()
         
         # Redraw plot
         self.canvas.fig.canvas.draw()
+
+        # Prepare the files the user is likely to step to next
+        self.prefetchNeighbours()
     
     # SpanSelector for audio
     def on_audio_select(self, start, stop):
+        if getattr(self, 'playing', False) or not hasattr(self, 'current_filename'):
+            return
+
         # Set start and stop for audio
         self.start_audio = start
         self.stop_audio = stop
@@ -474,82 +682,235 @@ class Widget(QDialog):
         try: self.audio_selector_span.remove()
         except: pass
 
-        # Update plot
+        # Update plot, the span changes the cached background so this is a full draw
         self.audio_selector_span = self.canvas.ax1.axvspan(start, stop, facecolor="black", alpha=0.1)
 
         # Move vertical line to right location
-        try: self.line.remove()
-        except: pass
-        self.line = self.canvas.ax1.axvline(start, color = 'r')
+        self.line.set_xdata([start, start])
+        self.canvas.fig.canvas.draw_idle()
+
+    # Rebuild the span collection from the segments of the current file
+    def updateSpans(self):
+        intervals = self.segments.segments(self.current_filename)
+        verts = np.zeros((len(intervals), 4, 2))
+        verts[:, 0:2, 0] = np.array(intervals.starts)[:, None]
+        verts[:, 2:4, 0] = np.array(intervals.stops)[:, None]
+        verts[:, 1:3, 1] = 1
+
+        self.segment_spans.set_verts(verts)
+        self.segment_spans.set_facecolors([self.labels.get(label, 'grey') for label in intervals.labels])
+
+    # Outline the proposed segments of the current file
+    def updateProposals(self):
+        times = np.array(self.times, dtype=float).reshape(-1, 2)
+        verts = np.zeros((len(times), 4, 2))
+        verts[:, 0:2, 0] = times[:, 0:1]
+        verts[:, 2:4, 0] = times[:, 1:2]
+        verts[:, 1:3, 1] = 1
+        self.proposal_spans.set_verts(verts)
 
     # Plot audiogram
     def plotSignal(self):
 
         # Build title
-        current = str(self.samples_stored.currentRow()+1)
-        total = str(len(self.filenames))
+        current = str(self.samples_stored.currentIndex().row()+1)
+        total = str(self.file_proxy.rowCount())
         title = "Audiofile " + current + "/" + total + ": " + self.current_filename
 
-        # Time and sigal data
-        time = self.filenames[self.current_filename]['time']
-        signal = self.filenames[self.current_filename]['signal']
-        
-        # Clear previous plot and build new plot
-        self.canvas.ax1.cla()
-        self.canvas.ax1.plot(time, signal, 'k', lw = 0.9)
+        # Amplitude axis is fixed per file from the coarsest envelope so zooming does not rescale it
+        info = self.filenames[self.current_filename]
+        _, mins, maxs = self.getPeaks(self.current_filename)[-1]
+        if len(mins) > 0:
+            margin = 0.05 * max(float(maxs.max()) - float(mins.min()), 1e-3)
+            self.canvas.ax1.set_ylim([float(mins.min()) - margin, float(maxs.max()) + margin])
                 
         # Scale time axis based on limits 
-        self.canvas.ax1.set_xlim([time[0],time[-1]])
+        self.canvas.ax1.set_xlim([0, info['duration']])
         self.canvas.ax1.set_yticklabels([])
-        self.canvas.ax1.set_xlabel("Time [s]",fontsize=8)
-        self.canvas.ax1.set_ylabel("Amplitude [-]", fontsize=8)
         self.canvas.ax1.set_title(title, fontsize=10) 
-        
-        for label in (self.canvas.ax1.get_xticklabels() + self.canvas.ax1.get_yticklabels()):
-            label.set_fontsize(8)
+        self.canvas.ax1.tick_params(labelsize=8)
 
+        self.refreshWaveform()
         self.canvas.fig.canvas.draw()
+
+    # Re-slice the visible window of the current file into the persistent waveform line
+    def refreshWaveform(self):
+        info = self.filenames[self.current_filename]
+        t0, t1 = self.canvas.ax1.get_xlim()
+        time, signal = envelope(self.getSignal(self.current_filename), self.getPeaks(self.current_filename),
+                                info['f_rate'], t0, t1, self.canvas.ax1.bbox.width)
+        self.waveform.set_data(time, signal)
+
+        # Spectrogram follows the same window
+        if self.show_spectrogram:
+            self.refreshSpectrogram()
+
+    # Split the plot area between the waveform and the spectrogram, or give it back to the waveform
+    def toggleSpectrogram(self, checked):
+        ax1 = self.canvas.ax1
+        if self.spectrogram is None:
+            self.waveform_position = ax1.get_position()
+            xlim = ax1.get_xlim()
+
+            ax2 = self.canvas.fig.add_axes(self.waveform_position.bounds, sharex = ax1)
+            ax2.set_ylabel("Frequency [Hz]", fontsize=8)
+            ax2.tick_params(labelsize=8)
+            self.spectrogram = ax2.imshow(np.full((1, 1), DB_FLOOR), origin = 'lower', aspect = 'auto',
+                                          cmap = 'magma', vmin = DB_FLOOR, vmax = 0, interpolation = 'nearest')
+
+            # The image is placed explicitly, it must not rescale the shared time axis
+            ax2.set_autoscale_on(False)
+            ax1.set_xlim(xlim)
+
+        ax2 = self.spectrogram.axes
+        x0, y0, width, height = self.waveform_position.bounds
+        if checked:
+            ax1.set_position([x0, y0 + height / 2, width, height / 2])
+            ax2.set_position([x0, y0, width, height / 2])
+        else:
+            ax1.set_position(self.waveform_position)
+
+        # Time axis is labeled under the lowest panel
+        ax2.set_visible(checked)
+        ax1.tick_params(labelbottom = not checked)
+        ax1.set_xlabel("" if checked else "Time [s]", fontsize=8)
+        ax2.set_xlabel("Time [s]", fontsize=8)
+
+        self.show_spectrogram = checked
+        if hasattr(self, 'current_filename'):
+            self.refreshWaveform()
+        self.canvas.fig.canvas.draw_idle()
+
+    # Spectrogram of the visible window at screen resolution, built from cached tiles
+    def refreshSpectrogram(self):
+        info = self.filenames[self.current_filename]
+        t0, t1 = self.canvas.ax1.get_xlim()
+        view = self.spectrogram_cache.view(self.current_filename, self.getSignal(self.current_filename),
+                                           info['f_rate'], t0, t1, self.canvas.ax1.bbox.width)
+        if view is None:
+            return
+
+        image, start, stop = view
+        self.spectrogram.set_data(image)
+        self.spectrogram.set_extent([start, stop, 0, info['f_rate'] / 2])
+        self.spectrogram.axes.set_ylim([0, info['f_rate'] / 2])
+
+    # Move the visible window, it is kept inside the file and never shorter than a few samples
+    def setView(self, t0, t1):
+        info = self.filenames[self.current_filename]
+        duration = info['duration']
+        width = min(max(t1 - t0, 32 / info['f_rate']), duration)
+        t0 = min(max(t0, 0), duration - width)
+
+        self.canvas.ax1.set_xlim([t0, t0 + width])
+        self.refreshWaveform()
+        self.canvas.fig.canvas.draw_idle()
      
-    def animate(self,i,start,diff):
-        location = start + time.time()-self.t
-        self.line.set_xdata(location)  # update the data.
-        if location >= self.stop_audio:
+    # Memory-mapped signal and peak pyramid of a file, kept in a small LRU cache
+    def getPlotData(self, filename):
+        if filename in self.plot_cache:
+            self.plot_cache.move_to_end(filename)
+        else:
+            self.loadPlotData(filename)
+        return self.plot_cache[filename]
+
+    # Open a file that is neither cached nor prefetched and look up its peaks
+    def loadPlotData(self, filename):
+        info = self.filenames[filename]
+        signal = open_signal(info)
+        self.storePlotData(filename, {'signal' : signal, 'peaks' : self.peak_cache.peaks_for(info['path'], signal)})
+
+    def storePlotData(self, filename, data):
+        self.plot_cache[filename] = data
+        while len(self.plot_cache) > PLOT_CACHE_SIZE:
+            self.plot_cache.popitem(last=False)
+
+    def getSignal(self, filename):
+        return self.getPlotData(filename)['signal']
+
+    def getPeaks(self, filename):
+        return self.getPlotData(filename)['peaks']
+
+    # Load the files around the current row in the background
+    def prefetchNeighbours(self):
+        row = self.samples_stored.currentIndex().row()
+        for offset in (1, -1, 2, -2):
+            filename = self.file_proxy.filename(row + offset)
+            if filename is None or filename in self.plot_cache or filename in self.prefetching:
+                continue
+
+            job = PrefetchJob(filename, self.filenames[filename], self.peak_cache)
+            job.signals.done.connect(self.onPrefetched)
+            self.prefetching.add(filename)
+            self.prefetch_pool.start(job)
+
+    def onPrefetched(self, filename, data):
+        self.prefetching.discard(filename)
+        if data is not None and filename not in self.plot_cache:
+            self.storePlotData(filename, data)
+
+    # Keep the rendered axes without the playhead after every full draw
+    def onDraw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.ax1.bbox)
+        self.canvas.ax1.draw_artist(self.line)
+
+    # Only the playhead is redrawn on top of the cached background
+    def movePlayhead(self, location):
+        self.line.set_xdata([location, location])
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.canvas.ax1.draw_artist(self.line)
+        self.canvas.blit(self.canvas.ax1.bbox)
+
+    # Cursor follows the position reported by the playback engine
+    def animate(self):
+        self.movePlayhead(self.player.position())
+        if not self.player.active():
             self.on_done()
-        return self.line,
 
     def on_done(self):
-        self.ani.event_source.stop()
+        self.playhead_timer.stop()
         self.playing = False
-        self.line.remove()
-        self.line = self.canvas.ax1.axvline(self.start_audio, color = 'r')
-        self.canvas.fig.canvas.draw()
+        self.movePlayhead(self.start_audio)
         self.enableGUIElements(True)
-    
-    def on_job_done(self):
-        try:
-            self.line.remove()
-            self.line = self.canvas.ax1.axvline(self.start_audio, color = 'r')
-            self.canvas.fig.canvas.draw()
-        except: pass
 
     def playAudio(self):
+        # Output device is opened on first use
+        if not hasattr(self, 'player'):
+            self.player = PlaybackEngine(on_error=self.playback_error.emit)
+            self.playback_error.connect(self.onPlaybackError)
+
         self.playing = True
         self.enableGUIElements(False)
-        start = self.start_audio
-        stop = self.stop_audio
-        diff = stop - start
-        song = AudioSegment.from_wav(os.getcwd() + '/audiofiles/' + self.current_filename)
-        sound = song[int(start*1000):int(stop*1000)]
-        self.worker_thread = WorkerThread(sound)
-        self.worker_thread.job_done.connect(self.on_job_done)
-        self.t = time.time()
-        self.worker_thread.start()
-        self.ani = animation.FuncAnimation(self.canvas.fig, self.animate, interval=20, fargs=(start,diff,), blit=True, repeat=False)
-        self.canvas.fig.canvas.draw()
+
+        # Streams from the memory-mapped signal, nothing is decoded up front
+        info = self.filenames[self.current_filename]
+        self.player.play(self.getSignal(self.current_filename), info['f_rate'], self.start_audio, self.stop_audio)
+        self.playhead_timer.start(PLAYHEAD_INTERVAL)
+
+    def onPlaybackError(self, message):
+        QMessageBox.warning(self, "Playback", message)
+
+    def pauseAudio(self):
+        if self.player.paused():
+            self.player.resume()
+            self.btn_pause_audio.setText("Pause")
+        else:
+            self.player.pause()
+            self.btn_pause_audio.setText("Resume")
+
+    # The playhead timer notices that the engine stopped and restores the UI
+    def stopAudio(self):
+        self.player.stop()
    
     # Helper function which makes enabling/disabling elements easy
     def enableGUIElements(self, boolean):
         self.btn_play_audio.setEnabled(boolean)
+        self.btn_pause_audio.setEnabled(not boolean)
+        self.btn_pause_audio.setText("Pause")
+        self.btn_stop_audio.setEnabled(not boolean)
         self.samples_stored.setEnabled(boolean)
         self.btn_import.setEnabled(boolean)
         self.btn_export.setEnabled(boolean)
@@ -562,7 +923,8 @@ class Widget(QDialog):
             #w.setCheckable(boolean)
             
     # This function updates plot based on row change
-    def updatePlot(self, row):
+    def updatePlot(self, current, previous=None):
+        row = current.row()
         
         # Remove selector
         try: self.area_selector.remove()
@@ -570,104 +932,221 @@ class Widget(QDialog):
         
         # Build area selector
         if row != -1:
-            # Get the current filename
-            subframe = self.df[self.df.filename == self.current_filename].iloc[row]
-            start = subframe['start']
-            stop = subframe['stop']
+            # Get the selected segment of the current file
+            _, start, stop = self.segments.segments(self.current_filename)[row]
             
             # Plot section and update
             self.area_selector = self.canvas.ax1.axvspan(start, stop, ec = 'r', lw = 1.5)
             self.area_selector.set_fill(False)
             self.canvas.fig.canvas.draw()
    
-    def buildDataFrame(self):
-        column_names = ["filename", "label", "start", "stop"]
-        self.df = pd.DataFrame(columns = column_names)
+    def buildSegmentStore(self):
+        self.segments = SegmentStore()
 
     # This function checks which row has been selected
     def interactionListener(self):
+        from canvas import MouseButton
         
         # This function is called when user clicks are in plot
         def onclick(event):
+            if event.inaxes != self.canvas.ax1:
+                return
             
+            # Right click while playing jumps to that position
+            if event.button == MouseButton.RIGHT and getattr(self, 'playing', False):
+                self.player.seek(event.xdata)
+                return
+
             # Set audio playing span
             if event.button == MouseButton.RIGHT:
                 if not (self.start_audio <= event.xdata <= self.stop_audio):
                     self.audio_selector_span.remove()
-                    self.start_audio = self.filenames[self.current_filename]['time'][0]
-                    self.stop_audio = self.filenames[self.current_filename]['time'][-1]
-                    self.line.set_xdata(self.start_audio)
+                    self.start_audio = 0
+                    self.stop_audio = self.filenames[self.current_filename]['duration']
+                    self.line.set_xdata([self.start_audio, self.start_audio])
+                    self.canvas.fig.canvas.draw_idle()
             
-            # Set segmentation span
-            if event.button == MouseButton.LEFT:
-                subframe = self.df[self.df.filename == self.current_filename]
-                if len(subframe) > 0:
-                    for index,(_, row) in enumerate(subframe.iterrows()):
-                        start = row['start']
-                        stop = row['stop']
-                        if start <= event.xdata <= stop:
-                            self.sample_segmentations.selectRow(index)
-                            break
+            # Set segmentation span, drags are handled by the span selector
+            if event.button == MouseButton.LEFT and self.press_x is not None and abs(event.x - self.press_x) <= 3:
+                hits = self.segments.segments(self.current_filename).hits(event.xdata)
+                if len(hits) > 0:
+
+                    # Repeated clicks on overlapping segments cycle through them
+                    row = self.sample_segmentations.currentIndex().row()
+                    if row in hits:
+                        row = hits[(hits.index(row) + 1) % len(hits)]
+                    else:
+                        row = hits[0]
+                    self.sample_segmentations.selectRow(row)
         
+        # Pixel position of the last left press, tells clicks apart from span drags
+        self.press_x = None
+
+        # Scroll zooms around the cursor
+        def onscroll(event):
+            if event.inaxes not in self.canvas.fig.axes or not hasattr(self, 'current_filename'):
+                return
+            t0, t1 = self.canvas.ax1.get_xlim()
+            scale = 0.8 if event.button == 'up' else 1.25
+            self.setView(event.xdata - (event.xdata - t0) * scale, event.xdata + (t1 - event.xdata) * scale)
+
+        # Middle click-drag pans, measured in pixels since the data coordinates move while panning
+        def onpress(event):
+            if event.button == MouseButton.MIDDLE and event.inaxes in self.canvas.fig.axes:
+                self.pan_start = (event.x, self.canvas.ax1.get_xlim())
+            if event.button == MouseButton.LEFT:
+                self.press_x = event.x
+
+        def onmotion(event):
+            if getattr(self, 'pan_start', None) is None:
+                return
+            x, (t0, t1) = self.pan_start
+            shift = (x - event.x) * (t1 - t0) / self.canvas.ax1.bbox.width
+            self.setView(t0 + shift, t1 + shift)
+
+        def onrelease(event):
+            if event.button == MouseButton.MIDDLE:
+                self.pan_start = None
+
+        # Envelope resolution follows the width of the canvas
+        def onresize(event):
+            if hasattr(self, 'current_filename'):
+                self.refreshWaveform()
+
         # Add clicklistener for selecting span in plot
         self.canvas.fig.canvas.mpl_connect('button_release_event', onclick)
+        self.canvas.fig.canvas.mpl_connect('scroll_event', onscroll)
+        self.canvas.fig.canvas.mpl_connect('button_press_event', onpress)
+        self.canvas.fig.canvas.mpl_connect('motion_notify_event', onmotion)
+        self.canvas.fig.canvas.mpl_connect('button_release_event', onrelease)
+        self.canvas.fig.canvas.mpl_connect('resize_event', onresize)
     
     # SpanSelector calls this function which updates the plot
     def onselect(self, start, stop):
+        if not hasattr(self, 'current_filename'):
+            return
+
         start = round(start,2)
         stop = round(stop,2)
 
-        # Update dataframe
-        self.df.loc[len(self.df)] = [self.current_filename, self.active_label, start, stop]
-        self.df = self.df.sort_values(['filename', 'start'], ascending=True)
-        self.df = self.df.reset_index(drop=True)
-        
-        # Get the right location to place row
-        subframe = self.df[self.df.filename == self.current_filename]
-        subframe = subframe.reset_index(drop = True)
-        idx = subframe[(subframe.start == start) & (subframe.stop == stop)].index[0]
-        
-        # Add to table
-        time_start = QTableWidgetItem(str(start)) 
-        time_start.setTextAlignment(Qt.AlignCenter)
-
-        time_end = QTableWidgetItem(str(stop))
-        time_end.setTextAlignment(Qt.AlignCenter)
-
-        self.sample_segmentations.insertRow(idx)
-        self.sample_segmentations.setItem(idx, 0, QTableWidgetItem(self.active_label))
-        self.sample_segmentations.setItem(idx, 1, time_start)
-        self.sample_segmentations.setItem(idx, 2, time_end)
+        # Update segment store and table, which returns the row of the new segment
+        idx = self.segment_model.add(self.active_label, start, stop)
+        self.journal.add(self.current_filename, self.active_label, start, stop)
+        self.updateIndex()
 
         # Update plot
-        self.segmentation_span.insert(idx,self.canvas.ax1.axvspan(start, stop, facecolor=self.labels[self.active_label], ec = 'k',  alpha=0.2))
+        self.updateSpans()
  
         # Select current row
         self.sample_segmentations.selectRow(idx)
         
+    # Edits are already journaled, closing only writes out what is still pending
     def closeEvent(self, event):
-        self.exportData()        
-
-class WorkerThread(QThread):
-        job_done = pyqtSignal()
-
-        def __init__(self, sound,parent=None):
-            super(WorkerThread, self).__init__(parent)
-            self.sound = sound
-
-        def do_work(self):
-            play(self.sound)            
-            self.job_done.emit()
-        
-        def run(self):
-            self.do_work()
+        try: self.player.stop()
+        except AttributeError: pass
+
+        # The scan writes to the caches until it stops, what it read so far is kept
+        if self.scan_thread is not None:
+            self.scan_thread.requestInterruption()
+            self.scan_thread.wait()
+            self.project_index.close()
+        try:
+            self.journal.close()
+            self.peak_cache.save()
+        except AttributeError: pass
+
+class PrefetchSignals(QObject):
+    done = pyqtSignal(str, object)
+
+# Opens a file and loads its peaks on a pool thread, results are handed back through a signal
+class PrefetchJob(QRunnable):
+    def __init__(self, filename, info, peak_cache):
+        super(PrefetchJob, self).__init__()
+        self.filename = filename
+        self.info = info
+        self.peak_cache = peak_cache
+        self.signals = PrefetchSignals()
+
+    def run(self):
+        try:
+            signal = open_signal(self.info)
+            peaks = self.peak_cache.peaks_for(self.info['path'], signal)
+        except Exception as e:
+            print(e)
+            self.signals.done.emit(self.filename, None)
+            return
+        self.signals.done.emit(self.filename, {'signal' : signal, 'peaks' : peaks})
+
+# Runs scan_audio and hands the results to the GUI thread in batches
+class ScanThread(QThread):
+    scanned = pyqtSignal(list)
+
+    def __init__(self, directory, workers, peak_cache, peak_workers, index=None, parent=None):
+        super(ScanThread, self).__init__(parent)
+        self.directory = directory
+        self.workers = workers
+        self.peak_cache = peak_cache
+        self.peak_workers = peak_workers
+        self.index = index
+
+    def run(self):
+        batch = []
+        last = time.time()
+        scan = scan_audio(self.directory, self.workers, self.peak_cache, self.peak_workers, self.index, self.isInterruptionRequested)
+        for file, info in scan:
+            if self.isInterruptionRequested():
+                scan.close()
+                return
+            batch.append((file, info))
+            if time.time() - last >= SCAN_BATCH_INTERVAL:
+                self.scanned.emit(batch)
+                batch = []
+                last = time.time()
+        if len(batch) > 0:
+            self.scanned.emit(batch)
+
+# Runs propose_all and hands the proposals of each file to the GUI thread
+class ProposeThread(QThread):
+    proposed = pyqtSignal(str, list)
+
+    def __init__(self, filenames, parent=None):
+        super(ProposeThread, self).__init__(parent)
+        self.filenames = filenames
+
+    def run(self):
+        for file, times in propose_all(self.filenames):
+            self.proposed.emit(file, times)
 
 # MAIN
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Label segments of the audiofiles in ./audiofiles",
+                                     epilog="The commands " + ", ".join(cli.COMMANDS) + " run without the GUI, see python cli.py --help")
+    parser.add_argument("--segmentations", default=SEGMENTATIONS_FILE,
+                        help="segmentation file to read and export, the format follows the extension (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="threads reading audiofile headers on import (default: %(default)s)")
+    parser.add_argument("--peak-workers", type=int, default=0,
+                        help="processes computing waveform peaks during import, 0 computes them when a file is opened (default: %(default)s)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each phase of starting up took")
+    parser.add_argument("--perf", action="store_true",
+                        help="time the main handlers and canvas draws, show them under the window and log them")
+    parser.add_argument("--perf-log",
+                        help="rotating log the timings are written to with --perf (default: labeler_perf.log)")
+    args = parser.parse_args()
+    try: segmentation_format(args.segmentations)
+    except ValueError as e: parser.error(str(e))
+
+    # Handlers are only wrapped when asked for, otherwise they run untouched
+    if args.perf:
+        import perf
+        perf.install(Widget, perf.PerfRecorder(args.perf_log or perf.LOG_FILE))
+
     MainEventHandler = QApplication([])
     
     # Build layout
-    application = Widget()
+    application = Widget(segmentations_file=args.segmentations, workers=args.workers, peak_workers=args.peak_workers,
+                         profile_startup=args.profile_startup)
     application.show() 
     
     sysExit(MainEventHandler.exec_())
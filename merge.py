@@ -0,0 +1,175 @@
+import os
+from collections import Counter, defaultdict
+
+from segmentation_file import iter_segmentations
+
+# Kinds of disagreement in the conflict report
+LABEL_CONFLICT = 'label'
+COVERAGE_CONFLICT = 'coverage'
+
+
+# Segments of several annotators grouped by audiofile, as (start, stop, annotator, label)
+# with the annotator being the position of its file in paths. Files are read in chunks,
+# only the segments are kept and never a whole file as a table
+def read_annotations(paths):
+    files = defaultdict(list)
+    for annotator, path in enumerate(paths):
+        for df in iter_segmentations(path):
+            for file, label, start, stop in zip(df['filename'], df['label'], df['start'].tolist(), df['stop'].tolist()):
+                if stop > start:
+                    files[file].append((start, stop, annotator, label))
+    return files
+
+
+# Sweep over the start and stop times of the segments of one audiofile. Yields every
+# stretch in which some annotator labels something as (start, stop, labels), labels
+# holding the label of every annotator, None where it has none and the labels joined
+# with '+' where its own segments overlap
+def sweep(segments, n_annotators):
+    events = []
+    for start, stop, annotator, label in segments:
+        events.append((start, 1, annotator, label))
+        events.append((stop, -1, annotator, label))
+    events.sort()
+
+    # Labels of the segments each annotator has open, only the one of the annotator
+    # whose segment starts or stops is recomputed
+    active = [{} for _ in range(n_annotators)]
+    current = [None] * n_annotators
+    covered = 0
+    last = None
+    for time, change, annotator, label in events:
+        if covered > 0 and time > last:
+            yield last, time, tuple(current)
+
+        labels = active[annotator]
+        count = labels.get(label, 0) + change
+        if count > 0:
+            labels[label] = count
+        else:
+            del labels[label]
+
+        if len(labels) == 0:
+            current[annotator] = None
+        elif len(labels) == 1:
+            current[annotator] = label if count > 0 else next(iter(labels))
+        else:
+            current[annotator] = '+'.join(sorted(labels))
+        covered += change
+        last = time
+
+
+# Label chosen for a stretch, the most frequent one if at least quorum annotators gave it
+def consensus(labels, quorum):
+    votes = Counter(label for label in labels if label is not None)
+    if len(votes) == 0:
+        return None
+    label, count = min(votes.items(), key=lambda item: (-item[1], item[0]))
+    return label if count >= quorum else None
+
+
+def disagreement(labels):
+    given = set(label for label in labels if label is not None)
+    if len(given) > 1:
+        return LABEL_CONFLICT
+    if None in labels:
+        return COVERAGE_CONFLICT
+    return None
+
+
+# Append a stretch to rows, extending the last row when it continues it
+def extend(rows, file, start, stop, *values):
+    if len(rows) > 0 and rows[-1][0] == file and rows[-1][2] == start and tuple(rows[-1][3:]) == values:
+        rows[-1][2] = stop
+    else:
+        rows.append([file, start, stop] + list(values))
+
+
+# Durations every pair of annotators spent on every pair of labels, and per label the
+# time all annotators agreed on it and the time any annotator gave it
+class Agreement:
+    def __init__(self, n_annotators):
+        self.n_annotators = n_annotators
+        self.pairs = {(a, b) : Counter() for a in range(n_annotators) for b in range(a + 1, n_annotators)}
+        self.label_all = Counter()
+        self.label_any = Counter()
+
+    def add(self, labels, duration):
+        for (a, b), confusion in self.pairs.items():
+            if labels[a] is not None or labels[b] is not None:
+                confusion[labels[a], labels[b]] += duration
+        given = set(labels)
+        for label in given - {None}:
+            self.label_any[label] += duration
+            if len(given) == 1:
+                self.label_all[label] += duration
+
+    # Share of the time both annotators gave the same label, and Cohen's kappa with
+    # durations as weights. Time neither of them labeled is left out
+    def pair(self, a, b):
+        confusion = self.pairs[a, b]
+        total = sum(confusion.values())
+        if total == 0:
+            return float('nan'), float('nan')
+
+        first, second = Counter(), Counter()
+        for (label_a, label_b), duration in confusion.items():
+            first[label_a] += duration
+            second[label_b] += duration
+        observed = sum(duration for (label_a, label_b), duration in confusion.items() if label_a == label_b) / total
+        expected = sum(first[label] * second[label] for label in first) / total ** 2
+        kappa = (observed - expected) / (1 - expected) if expected < 1 else 1.0
+        return observed, kappa
+
+    def summary(self):
+        pairs = {}
+        for a, b in self.pairs:
+            observed, kappa = self.pair(a, b)
+            pairs[a, b] = {'agreement' : observed, 'kappa' : kappa}
+        labels = {label : self.label_all[label] / self.label_any[label] for label in sorted(self.label_any)}
+        return {'pairs' : pairs, 'labels' : labels}
+
+
+# Merge the segmentation files of several annotators. A stretch gets the label given by
+# at least quorum annotators, a majority by default. Returns the merged segments and the
+# stretches the annotators disagree on as rows, and the agreement summary
+def merge(paths, quorum=None):
+    quorum = quorum if quorum is not None else len(paths) // 2 + 1
+    merged, conflicts = [], []
+
+    # Few combinations of labels occur, the outcome and the time are kept per combination
+    decided = {}
+    durations = Counter()
+
+    files = read_annotations(paths)
+    for file in sorted(files):
+        for start, stop, labels in sweep(files[file], len(paths)):
+            durations[labels] += stop - start
+            if labels not in decided:
+                decided[labels] = consensus(labels, quorum), disagreement(labels)
+            label, kind = decided[labels]
+
+            if label is not None:
+                extend(merged, file, start, stop, label)
+            if kind is not None:
+                extend(conflicts, file, start, stop, kind, *labels)
+
+    agreement = Agreement(len(paths))
+    for labels, duration in durations.items():
+        agreement.add(labels, duration)
+
+    return [(file, label, start, stop) for file, start, stop, label in merged], conflicts, agreement.summary()
+
+
+# Annotators are named after their segmentation files. Files with the same name (e.g.
+# anna/labels.csv and ben/labels.csv) get the number of their repetition appended
+def annotator_names(paths):
+    names = []
+    for path in paths:
+        stem = name = os.path.splitext(os.path.basename(path))[0]
+        repeat = 1
+        while name in names:
+            repeat += 1
+            name = "%s-%d" % (stem, repeat)
+        names.append(name)
+    return names
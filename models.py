@@ -0,0 +1,205 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QModelIndex, pyqtSignal
+
+
+# Filenames of the imported audiofiles. The model sorts itself, sorting through the proxy
+# would call back into Python for every comparison
+class FileListModel(QAbstractTableModel):
+    def __init__(self, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self.files = []
+
+        # Order the files are kept in, None keeps the scan order
+        self.order = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.files)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.files[index.row()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return 'Filenames'
+        return super(FileListModel, self).headerData(section, orientation, role)
+
+    # Add a batch of files. In scan order the batch is appended, otherwise it is sorted
+    # and merged in with one insert per run of files that land between the same rows, so
+    # a batch never reorders (and refilters) the rows already in the list
+    def addFiles(self, files):
+        if len(files) == 0:
+            return
+        if self.order is None:
+            first = len(self.files)
+            self.beginInsertRows(QModelIndex(), first, first + len(files) - 1)
+            self.files.extend(files)
+            self.endInsertRows()
+            return
+
+        descending = self.order == Qt.DescendingOrder
+        batch = sorted(files, reverse=descending)
+        i = 0
+        while i < len(batch):
+            row = self.position(batch[i])
+            j = i + 1
+            while j < len(batch) and (row == len(self.files) or (batch[j] > self.files[row] if descending else batch[j] < self.files[row])):
+                j += 1
+            self.beginInsertRows(QModelIndex(), row, row + j - i - 1)
+            self.files[row:row] = batch[i:j]
+            self.endInsertRows()
+            i = j
+
+    # Row a file is inserted at in the current order, after files that compare equal
+    def position(self, file):
+        descending = self.order == Qt.DescendingOrder
+        lo, hi = 0, len(self.files)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (file > self.files[mid]) if descending else (file < self.files[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    # Row of a file, None when it is not in the list
+    def row(self, file):
+        if self.order is None:
+            try: return self.files.index(file)
+            except ValueError: return None
+        row = self.position(file) - 1
+        return row if row >= 0 and self.files[row] == file else None
+
+    # Selections and the current row follow their files through the layout change
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.order = order
+        self.layoutAboutToBeChanged.emit()
+
+        rows = sorted(range(len(self.files)), key=self.files.__getitem__, reverse=order == Qt.DescendingOrder)
+        self.files = [self.files[row] for row in rows]
+
+        # Only a handful of indexes are persistent, the current row and the selection
+        persistent = self.persistentIndexList()
+        self.changePersistentIndexList(persistent, [self.index(rows.index(index.row()), index.column()) for index in persistent])
+        self.layoutChanged.emit()
+
+
+# Filtered view on a FileListModel, rows are numbered as they are shown
+class FileFilterModel(QSortFilterProxyModel):
+    # Emitted after the filter changed, the view has lost its current row by then
+    filterChanged = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(FileFilterModel, self).__init__(parent)
+        self.text = ''
+
+        # Filenames that are shown, or hidden with exclude. None shows all
+        self.files = None
+        self.exclude = False
+
+    # Case-insensitive substring filter, compared on the source list directly
+    def setFilterText(self, text):
+        self.text = text.lower()
+        self.invalidateFilter()
+        self.filterChanged.emit()
+
+    # Restrict the list to a set of filenames, e.g. the result of a project index query
+    def setFilterFiles(self, files, exclude=False):
+        self.files = files
+        self.exclude = exclude
+        self.invalidateFilter()
+        self.filterChanged.emit()
+
+    def filterAcceptsRow(self, row, parent):
+        file = self.sourceModel().files[row]
+        if self.files is not None and (file in self.files) == self.exclude:
+            return False
+        return not self.text or self.text in file.lower()
+
+    # Sorting is done by the source model, the proxy keeps its order
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Vertical:
+            return section + 1
+        return super(FileFilterModel, self).headerData(section, orientation, role)
+
+    # Filename shown at row, None when there is no such row
+    def filename(self, row):
+        index = self.index(row, 0)
+        return index.data() if index.isValid() else None
+
+    # Index a file is shown at, invalid when it is filtered out
+    def indexOf(self, file):
+        row = self.sourceModel().row(file)
+        if row is None:
+            return QModelIndex()
+        return self.mapFromSource(self.sourceModel().index(row, 0))
+
+
+# Segments of one file, read straight from the segment store. Edits go through the
+# model so views are told which rows changed
+class SegmentTableModel(QAbstractTableModel):
+    HEADERS = ['Label', 'Start [s]', 'Stop [s]']
+
+    def __init__(self, parent=None):
+        super(SegmentTableModel, self).__init__(parent)
+        self.store = None
+        self.filename = None
+
+    def intervals(self):
+        return self.store.segments(self.filename)
+
+    # Show the segments of another file
+    def setFile(self, store, filename):
+        self.beginResetModel()
+        self.store = store
+        self.filename = filename
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.store is None else len(self.intervals())
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            value = self.intervals()[index.row()][index.column()]
+            return value if index.column() == 0 else str(round(value, 2))
+        if role == Qt.TextAlignmentRole and index.column() > 0:
+            return Qt.AlignCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super(SegmentTableModel, self).headerData(section, orientation, role)
+
+    # Add a segment to the store and return its row
+    def add(self, label, start, stop):
+        row = self.intervals().position(start)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.store.add(self.filename, label, start, stop)
+        self.endInsertRows()
+        return row
+
+    # Add a batch of segments to the store, views are reset once instead of per row
+    def extend(self, labels, starts, stops):
+        self.beginResetModel()
+        rows = self.store.extend(self.filename, labels, starts, stops)
+        self.endResetModel()
+        return rows
+
+    # Remove the segment at row from the store and return it
+    def remove(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        segment = self.store.remove(self.filename, row)
+        self.endRemoveRows()
+        return segment
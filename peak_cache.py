@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+
+from peaks import LEVELS, build_pyramid, pyramid_from_base
+
+CACHE_DIR = '.labeler_cache'
+
+# Upper bound for the peak files on disk, least recently used files are evicted first
+MAX_BYTES = 512 * 1024 ** 2
+
+# Bump when the layout of the cached data changes, entries of other versions are dropped
+CACHE_VERSION = 3
+
+# Entries kept in the index. Beyond this the least recently used entries are dropped,
+# whether they hold peaks or only a header, until a tenth of the room is free again
+MAX_ENTRIES = 500000
+
+
+class PeakCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+
+        # Peaks are also loaded from prefetch threads
+        self.lock = threading.RLock()
+
+        # The index is written on a thread of its own while labeling, one write at a time
+        self.save_lock = threading.Lock()
+        self.saver = None
+
+        try:
+            with open(self.index_path, 'r') as json_file:
+                self.index = json.load(json_file)
+        except (IOError, ValueError):
+            self.index = {}
+
+        # Entries of older cache versions and entries holding nothing are dropped, their
+        # peak files go with the files below
+        self.index = {key : entry for key, entry in self.index.items()
+                      if entry.get('version') == CACHE_VERSION and ('info' in entry or 'peaks' in entry)}
+
+        # Key of the newest entry of every file, the entry of a file that changed is replaced
+        self.keys = {entry['path'] : key for key, entry in sorted(self.index.items(), key=lambda item: item[1].get('used', 0))}
+        self.index = {key : self.index[key] for key in self.keys.values()}
+
+        # Only written back when something changed. Lookups only move entries up the LRU
+        # order, which is kept when the cache is closed but is no reason to write it
+        self.dirty = False
+        self.touched = False
+
+        # Remove peak files which are not in the index and temporary files, e.g. after a crash
+        known = set(entry['peaks'] for entry in self.index.values() if 'peaks' in entry)
+        for name in os.listdir(directory):
+            if name.endswith('.npy') and name not in known:
+                os.remove(os.path.join(directory, name))
+
+    # Files are identified by their path, size and modification time
+    def key(self, path):
+        stat = os.stat(path)
+        raw = "%d|%s|%d|%d" % (CACHE_VERSION, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def entry(self, path):
+        try: key = self.key(path)
+        except OSError: return None
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                entry['used'] = time.time()
+                self.touched = True
+            return entry
+
+    def get_info(self, path):
+        entry = self.entry(path)
+        if entry is not None:
+            return entry.get('info')
+
+    # Entry of path under key, an entry of an older state of the file is dropped. Called with the lock held
+    def update(self, path, key, values):
+        old = self.keys.get(path)
+        if old is not None and old != key:
+            self.drop(old)
+        self.keys[path] = key
+        # Entries are replaced rather than grown or shrunk, so save can write a shallow copy
+        entry = dict(self.index.get(key) or {'path' : path, 'version' : CACHE_VERSION})
+        entry.update(values, used=time.time())
+        self.index[key] = entry
+        self.dirty = True
+
+    def drop(self, key):
+        entry = self.index.pop(key)
+        if self.keys.get(entry['path']) == key:
+            del self.keys[entry['path']]
+        if 'peaks' in entry:
+            try: os.remove(os.path.join(self.directory, entry['peaks']))
+            except OSError: pass
+
+    def put_info(self, path, info):
+        key = self.key(path)
+        with self.lock:
+            self.update(path, key, {'info' : info})
+            if len(self.index) > MAX_ENTRIES:
+                self.evict()
+
+    def has_peaks(self, path):
+        entry = self.entry(path)
+        return entry is not None and 'peaks' in entry
+
+    def get_peaks(self, path):
+        entry = self.entry(path)
+        if entry is None or 'peaks' not in entry:
+            return None
+        try: base = np.load(os.path.join(self.directory, entry['peaks']))
+        except (IOError, ValueError): return None
+        return pyramid_from_base(base[:, 0], base[:, 1], LEVELS)
+
+    def put_peaks(self, path, pyramid):
+        key = self.key(path)
+        _, mins, maxs = pyramid[0]
+
+        # Only the finest level is stored, coarser levels are cheap to derive. A file may be
+        # stored from several threads at once (scan, prefetch, GUI), each writes its own
+        # temporary file and the first one to finish is moved into place
+        filename = key + '.npy'
+        tmp = os.path.join(self.directory, "%s.%d.%d.tmp.npy" % (key, os.getpid(), threading.get_ident()))
+        np.save(tmp, np.stack([mins, maxs], axis=1))
+
+        with self.lock:
+            if 'peaks' in self.index.get(key, {}):
+                os.remove(tmp)
+                return
+            os.replace(tmp, os.path.join(self.directory, filename))
+            self.update(path, key, {'peaks' : filename, 'bytes' : os.path.getsize(os.path.join(self.directory, filename))})
+            self.evict()
+
+    # Cached peaks of a file, computed from the signal and stored when missing
+    def peaks_for(self, path, signal):
+        pyramid = self.get_peaks(path)
+        if pyramid is None:
+            pyramid = build_pyramid(signal)
+            self.put_peaks(path, pyramid)
+        return pyramid
+
+    # Drop least recently used peak files until the cache fits in max_bytes, and least
+    # recently used entries until there are at most MAX_ENTRIES
+    def evict(self):
+        with self.lock:
+            if len(self.index) > MAX_ENTRIES:
+                by_use = sorted((entry['used'], key) for key, entry in self.index.items())
+                for _, key in by_use[:len(self.index) - MAX_ENTRIES * 9 // 10]:
+                    self.drop(key)
+                self.dirty = True
+
+            entries = sorted((entry['used'], key) for key, entry in self.index.items() if 'peaks' in entry)
+            total = sum(self.index[key]['bytes'] for _, key in entries)
+
+            for _, key in entries:
+                if total <= self.max_bytes:
+                    break
+                entry = self.index[key]
+                total -= entry['bytes']
+                self.dirty = True
+
+                # An entry without a header has nothing left once its peaks are gone
+                if 'info' not in entry:
+                    self.drop(key)
+                    continue
+                try: os.remove(os.path.join(self.directory, entry['peaks']))
+                except OSError: pass
+                self.index[key] = {name : value for name, value in entry.items() if name not in ('peaks', 'bytes')}
+
+    # Write the index if entries changed, or also if they were only used unless
+    # changed_only. The index is copied under the lock and written without it, so
+    # lookups from other threads do not wait for the write
+    def save(self, changed_only=False):
+        tmp = self.index_path + '.tmp'
+        with self.save_lock:
+            with self.lock:
+                if not (self.dirty or (self.touched and not changed_only)):
+                    return
+                index = dict(self.index)
+                self.dirty = self.touched = False
+            try:
+                with open(tmp, 'w') as json_file:
+                    json.dump(index, json_file)
+                os.replace(tmp, self.index_path)
+            except Exception:
+                self.dirty = True
+                raise
+
+    # Save changed entries on a thread, skipped while the previous save is still running
+    def save_async(self):
+        if self.saver is not None and self.saver.is_alive():
+            return
+        self.saver = threading.Thread(target=self.save, args=(True,), daemon=True)
+        self.saver.start()
@@ -0,0 +1,95 @@
+import numpy as np
+
+# Samples per bucket for each level of the pyramid, finest first
+LEVELS = (256, 1024, 4096)
+
+# Samples reduced at a time, keeps memory bounded on memory-mapped files
+CHUNK = LEVELS[0] * 4096
+
+
+# Reduce to the min and max of consecutive buckets of `factor` values
+def min_max(mins, maxs, factor):
+    if len(mins) == 0:
+        return mins, maxs
+    n = len(mins) // factor * factor
+
+    lo = mins[:n].reshape(-1, factor).min(axis=1)
+    hi = maxs[:n].reshape(-1, factor).max(axis=1)
+
+    # Last bucket may be shorter than the others
+    if n < len(mins):
+        lo = np.append(lo, mins[n:].min())
+        hi = np.append(hi, maxs[n:].max())
+    return lo, hi
+
+
+# Compute the min/max envelope of a signal at every level in LEVELS
+def build_pyramid(signal, levels=LEVELS):
+    base = levels[0]
+    n_buckets = -(-len(signal) // base)
+    mins = np.empty(n_buckets, dtype=signal.dtype)
+    maxs = np.empty(n_buckets, dtype=signal.dtype)
+
+    # Finest level is read from the signal in chunks
+    for start in range(0, len(signal), CHUNK):
+        block = np.asarray(signal[start:start + CHUNK])
+        lo, hi = min_max(block, block, base)
+        mins[start // base:start // base + len(lo)] = lo
+        maxs[start // base:start // base + len(hi)] = hi
+
+    return pyramid_from_base(mins, maxs, levels)
+
+
+# Derive the coarser levels from the finest one
+def pyramid_from_base(mins, maxs, levels=LEVELS):
+    pyramid = [(levels[0], mins, maxs)]
+    for factor in levels[1:]:
+        prev_factor, prev_mins, prev_maxs = pyramid[-1]
+        lo, hi = min_max(prev_mins, prev_maxs, factor // prev_factor)
+        pyramid.append((factor, lo, hi))
+
+    return pyramid
+
+
+# Build plot-ready x/y data for the time window [t0, t1] drawn `width` pixels wide
+def envelope(signal, pyramid, f_rate, t0, t1, width):
+    first = max(0, int(t0 * f_rate))
+    last = min(len(signal), int(np.ceil(t1 * f_rate)) + 1)
+    per_pixel = (last - first) / max(width, 1)
+
+    # Zoomed in far enough to draw every sample
+    if per_pixel < 2:
+        return np.arange(first, last) / f_rate, np.asarray(signal[first:last])
+
+    # Coarsest level which still has at least one bucket per pixel
+    level = None
+    for factor, mins, maxs in pyramid:
+        if factor <= per_pixel:
+            level = (factor, mins, maxs)
+
+    if level is None:
+        # Between raw samples and the finest level, the window is small so reduce it directly
+        factor = int(per_pixel)
+        first = first // factor * factor
+        block = np.asarray(signal[first:last])
+        lo, hi = min_max(block, block, factor)
+        b0 = first // factor
+    else:
+        # Merge buckets of the level further so there is about one bucket per pixel
+        factor, mins, maxs = level
+        step = int(per_pixel // factor)
+        b0 = first // (factor * step) * step
+        b1 = min(len(mins), -(-last // factor))
+        lo, hi = min_max(mins[b0:b1], maxs[b0:b1], step)
+        factor *= step
+        b0 //= step
+
+    # Interleave min and max so the envelope is drawn as a single line, every other
+    # bucket is reversed so the line runs max-max and min-min instead of zig-zagging
+    x = np.repeat((b0 + np.arange(len(lo))) * factor / f_rate, 2)
+    y = np.empty(2 * len(lo), dtype=lo.dtype)
+    y[0::4] = lo[0::2]
+    y[1::4] = hi[0::2]
+    y[2::4] = hi[1::2]
+    y[3::4] = lo[1::2]
+    return x, y
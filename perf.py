@@ -0,0 +1,171 @@
+import os
+import time
+import logging
+import platform
+import threading
+import functools
+from logging.handlers import RotatingFileHandler
+
+from spectrogram import SpectrogramCache
+
+# Opt-in instrumentation of the GUI, see --perf. Nothing here is imported or patched
+# unless it is switched on, so a normal session runs the plain handlers
+
+# Widget methods whose duration is recorded, the slots the user waits on
+HANDLERS = ('importData', 'itemActivated', 'plotSignal', 'onselect', 'delete', 'playAudio', 'exportData')
+
+# Every timed call is appended to this log in the working directory, rotated at
+# LOG_BYTES with LOG_BACKUPS old logs kept
+LOG_FILE = "labeler_perf.log"
+LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+# Interval in ms at which the overlay is refreshed
+OVERLAY_INTERVAL = 1000
+
+# Cache hit rates are written to the log this often, in seconds
+CACHE_LOG_INTERVAL = 60
+
+
+# Durations of handler calls and hits and misses of the caches. Hits and misses are
+# counted in the GUI thread, the overlay reads them from its timer under the lock
+class PerfRecorder:
+    def __init__(self, path=LOG_FILE):
+        # name -> [calls, total ms, slowest ms, last ms]
+        self.timings = {}
+        # name -> [hits, misses]
+        self.caches = {}
+        self.lock = threading.Lock()
+        self.last_cache_log = time.time()
+
+        self.logger = logging.getLogger('labeler.perf')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        handler = RotatingFileHandler(path, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS)
+        handler.setFormatter(logging.Formatter('%(asctime)s\t%(message)s'))
+        self.logger.addHandler(handler)
+
+        # Slow machines are told apart by the first line of every session
+        self.logger.info("session\t%s\t%s\tpython %s\t%s cpus", platform.node(), platform.platform(),
+                         platform.python_version(), os.cpu_count())
+
+    def record(self, name, ms, filename=None):
+        with self.lock:
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += ms
+            timing[2] = max(timing[2], ms)
+            timing[3] = ms
+        self.logger.info("%s\t%.1f ms\t%s", name, ms, filename or '')
+
+    def count(self, cache, hit):
+        with self.lock:
+            self.caches.setdefault(cache, [0, 0])[0 if hit else 1] += 1
+
+    def hit_rates(self):
+        with self.lock:
+            return {cache : hits / (hits + misses) for cache, (hits, misses) in self.caches.items()}
+
+    def log_caches(self):
+        self.last_cache_log = time.time()
+        rates = self.hit_rates()
+        if rates:
+            self.logger.info("caches\t%s", "\t".join("%s %.0f%%" % (cache, 100 * rate) for cache, rate in sorted(rates.items())))
+
+    # Last and slowest duration of every handler and the cache hit rates, for the overlay
+    def status(self):
+        with self.lock:
+            timings = [(name, timing[3], timing[2]) for name, timing in self.timings.items()]
+        parts = ["%s %.0f ms (max %.0f)" % timing for timing in sorted(timings)]
+        parts += ["%s cache %.0f%%" % (cache, 100 * rate) for cache, rate in sorted(self.hit_rates().items())]
+        return " | ".join(parts)
+
+
+# Wrap a method so its duration is recorded, together with the file open at the time.
+# Qt passes slots every argument of the signal (e.g. checked of clicked) unless they take
+# fewer, so the wrapper passes on no more arguments than the method takes
+def timed(recorder, name, method):
+    n_args = method.__code__.co_argcount - 1
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        begin = time.perf_counter()
+        try: return method(self, *args[:n_args])
+        finally: recorder.record(name, 1000 * (time.perf_counter() - begin), getattr(self, 'current_filename', None))
+    return wrapper
+
+
+# Wrap a cache lookup so hits and misses are counted, is_hit tells them apart before the call
+def counted(recorder, cache, method, is_hit):
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        recorder.count(cache, is_hit(self, *args))
+        return method(self, *args)
+    return wrapper
+
+
+# Show the recorded timings under the window and time every draw of the canvas
+def attach(widget, recorder):
+    from PyQt5.QtWidgets import QStatusBar
+    from PyQt5.QtCore import QTimer
+
+    # Handlers of the draw event (span selectors) draw the canvas again from within a
+    # draw, these are recorded apart so draw is what a full redraw costs
+    canvas = widget.canvas
+    draw = canvas.draw
+    depth = [0]
+    def timed_draw(*args):
+        begin = time.perf_counter()
+        depth[0] += 1
+        try: return draw(*args)
+        finally:
+            depth[0] -= 1
+            recorder.record('draw' if depth[0] == 0 else 'nested draw', 1000 * (time.perf_counter() - begin),
+                            getattr(widget, 'current_filename', None))
+    canvas.draw = timed_draw
+
+    widget.perf_bar = QStatusBar()
+    widget.perf_bar.setSizeGripEnabled(False)
+    widget.layout().addWidget(widget.perf_bar, 11, 0, 1, 4)
+
+    def refresh():
+        widget.perf_bar.showMessage(recorder.status())
+        if time.time() - recorder.last_cache_log >= CACHE_LOG_INTERVAL:
+            recorder.log_caches()
+    widget.perf_timer = QTimer(widget)
+    widget.perf_timer.timeout.connect(refresh)
+    widget.perf_timer.start(OVERLAY_INTERVAL)
+
+
+# Patch the handlers of the widget class and the caches. Must run before the widget is
+# built, since signals are connected to the methods found at that time
+def install(widget_class, recorder):
+    for name in HANDLERS:
+        setattr(widget_class, name, timed(recorder, name, getattr(widget_class, name)))
+
+    # Counted once per file switch, the plotted file is looked up many times while drawing it.
+    # Peaks are counted when a switch has to open the file itself, prefetch threads are not
+    # what the user waits on
+    item_activated = widget_class.itemActivated
+    @functools.wraps(item_activated)
+    def itemActivated(self, current, previous=None):
+        if current.isValid() and current.data() != getattr(self, 'current_filename', None):
+            recorder.count('plot', current.data() in self.plot_cache)
+        return item_activated(self, current, previous)
+    widget_class.itemActivated = itemActivated
+
+    widget_class.loadPlotData = counted(recorder, 'peaks', widget_class.loadPlotData,
+                                        lambda self, filename: self.peak_cache.has_peaks(self.filenames[filename]['path']))
+    SpectrogramCache.tile = counted(recorder, 'spectrogram', SpectrogramCache.tile,
+                                    lambda self, filename, signal, hop, idx, total: (filename, hop, idx) in self.tiles)
+
+    create_plot_area = widget_class.createPlotArea
+    def createPlotArea(self):
+        create_plot_area(self)
+        attach(self, recorder)
+    widget_class.createPlotArea = createPlotArea
+
+    close_event = widget_class.closeEvent
+    def closeEvent(self, event):
+        recorder.log_caches()
+        close_event(self, event)
+    widget_class.closeEvent = closeEvent
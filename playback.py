@@ -0,0 +1,193 @@
+import time
+import wave
+import threading
+import numpy as np
+
+# Frames handed to the sink at a time, small blocks keep stop, pause and seek responsive
+BLOCK_FRAMES = 1024
+
+
+# Plays through the default output device, needs the sounddevice package (PortAudio)
+class SoundDeviceSink:
+    def __init__(self, device=None):
+        import sounddevice
+        self.sounddevice = sounddevice
+        self.device = device
+        self.stream = None
+
+    def open(self, f_rate, channels, dtype):
+        self.f_rate = f_rate
+        self.stream = self.sounddevice.OutputStream(samplerate=f_rate, channels=channels, dtype=dtype,
+                                                    device=self.device, latency='low')
+        self.stream.start()
+
+    # Blocks until the device has room for the block, this paces the engine
+    def write(self, block):
+        self.stream.write(block.reshape(len(block), -1))
+
+    # Frames accepted by the sink which have not been heard yet
+    def latency(self):
+        return int(self.stream.latency * self.f_rate) if self.stream is not None else 0
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+
+# Discards the audio. In realtime mode writes take as long as the audio would play,
+# which makes it a stand-in for a sound card on headless machines and in tests
+class NullSink:
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.frames = 0
+
+    def open(self, f_rate, channels, dtype):
+        self.f_rate = f_rate
+
+    def write(self, block):
+        self.frames += len(block)
+        if self.realtime:
+            time.sleep(len(block) / self.f_rate)
+
+    def latency(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+# Writes the played audio to a WAV file
+class FileSink(NullSink):
+    def __init__(self, path, realtime=False):
+        super(FileSink, self).__init__(realtime)
+        self.path = path
+        self.file = None
+
+    def open(self, f_rate, channels, dtype):
+        super(FileSink, self).open(f_rate, channels, dtype)
+        self.dtype = np.dtype(dtype)
+        self.file = wave.open(self.path, 'wb')
+        self.file.setnchannels(channels)
+        self.file.setframerate(f_rate)
+        self.file.setsampwidth(2 if self.dtype.kind == 'f' else self.dtype.itemsize)
+
+    def write(self, block):
+        # WAV files written by the wave module are PCM, floats are converted to 16 bit
+        if self.dtype.kind == 'f':
+            block = (np.clip(block, -1, 1) * 32767).astype(np.int16)
+        self.file.writeframes(block.tobytes())
+        super(FileSink, self).write(block)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# The best sink available on this machine
+def default_sink():
+    try: return SoundDeviceSink()
+    except (ImportError, OSError) as e:
+        print("No audio output available, playback is silent: " + str(e))
+        return NullSink(realtime=True)
+
+
+# Streams a signal to a sink in small blocks on a background thread. The signal can be
+# a memory map, only the blocks being played are read. When the sink fails to open or
+# write, on_error is called with the message from the playback thread and the rest is
+# played silently, so the playhead still runs to the end
+class PlaybackEngine:
+    def __init__(self, sink=None, on_error=None):
+        self.sink = self.device_sink = sink if sink is not None else default_sink()
+        self.on_error = on_error
+        self.thread = None
+        self.lock = threading.Lock()
+        self.running = threading.Event()
+        self.stopping = False
+        self.f_rate = 1
+        self.frame = 0
+        self.stop_frame = 0
+
+        # End of the last block the sink accepted, the read position runs one block ahead
+        self.written = 0
+
+    # Play signal from start to stop seconds, any playback in progress is stopped first
+    def play(self, signal, f_rate, start, stop):
+        self.stop()
+
+        # Every playback tries the device again, it may be back after a failure
+        self.sink = self.device_sink
+        self.signal = signal
+        self.f_rate = f_rate
+        self.frame = self.written = max(0, int(start * f_rate))
+        self.stop_frame = min(len(signal), int(stop * f_rate))
+        self.stopping = False
+        self.running.set()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        channels = 1 if self.signal.ndim == 1 else self.signal.shape[1]
+        try: self.sink.open(self.f_rate, channels, self.signal.dtype)
+        except Exception as e: self.fail(e, channels)
+        try:
+            while not self.stopping:
+                self.running.wait()
+                with self.lock:
+                    if self.stopping or self.frame >= self.stop_frame:
+                        break
+                    block = np.ascontiguousarray(self.signal[self.frame:min(self.frame + BLOCK_FRAMES, self.stop_frame)])
+                    self.frame += len(block)
+                    end = self.frame
+                try: self.sink.write(block)
+                except Exception as e: self.fail(e, channels)
+
+                # A seek during the write moved the position, the block no longer counts
+                with self.lock:
+                    if self.frame == end:
+                        self.written = end
+        finally:
+            self.sink.close()
+
+    # Report a failing device and carry on with a silent sink
+    def fail(self, error, channels):
+        try: self.sink.close()
+        except Exception: pass
+        self.sink = NullSink(realtime=True)
+        self.sink.open(self.f_rate, channels, self.signal.dtype)
+        message = "Audio output failed, playback is silent: " + str(error)
+        if self.on_error is not None:
+            self.on_error(message)
+        else:
+            print(message)
+
+    # Position in seconds of the audio currently coming out of the sink
+    def position(self):
+        return max(0, self.written - self.sink.latency()) / self.f_rate
+
+    def active(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def paused(self):
+        return self.active() and not self.running.is_set()
+
+    # The block being written finishes, nothing is written after it until resume
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def seek(self, t):
+        with self.lock:
+            self.frame = self.written = min(max(0, int(t * self.f_rate)), self.stop_frame)
+
+    def stop(self):
+        self.stopping = True
+        self.running.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,64 @@
+import os
+import json
+
+from segments import SegmentStore
+from journal import Journal
+from segmentation_file import read_segmentations, write_segmentations
+
+# Format of the segmentation file follows its extension, see segmentation_file.FORMATS
+SEGMENTATIONS_FILE = "segmentations.parquet"
+
+# Read when SEGMENTATIONS_FILE does not exist yet, projects started before other formats were supported
+LEGACY_SEGMENTATIONS_FILE = "segmentations.xlsx"
+
+AUDIO_DIR = "audiofiles"
+LABELS_FILE = "labels.json"
+
+
+# Labels and their colors, in the order of labels.json
+def load_labels(path=LABELS_FILE):
+    try:
+        with open(path, 'r') as json_file:
+            return json.load(json_file)
+    except IOError: return {}
+
+
+# Segments stored in a segmentation file, empty when there is none yet
+def load_segmentations(path=SEGMENTATIONS_FILE):
+    if not os.path.exists(path) and os.path.exists(LEGACY_SEGMENTATIONS_FILE):
+        path = LEGACY_SEGMENTATIONS_FILE
+    try: return SegmentStore.from_dataframe(read_segmentations(path))
+    except IOError: return SegmentStore()
+
+
+# Every segmentation file has its own journal next to it, segmentations.parquet.journal
+# by default. The full name is kept, files of different formats are different projects
+def journal_path(path=SEGMENTATIONS_FILE):
+    return path + '.journal'
+
+
+# Journal of a segmentation file, not replayed yet. A journal of the older naming
+# (segmentations.journal) is taken over, replay sets it aside if it is not this file's
+def open_journal(path=SEGMENTATIONS_FILE):
+    journal = journal_path(path)
+    legacy = os.path.splitext(path)[0] + '.journal'
+    if not os.path.exists(journal) and os.path.exists(legacy):
+        os.replace(legacy, journal)
+    return Journal(journal, base=path)
+
+
+# Segments of a project including the edits which were not exported yet. The journal
+# is open afterwards and records further edits
+def open_project(path=SEGMENTATIONS_FILE):
+    store = load_segmentations(path)
+    journal = open_journal(path)
+    journal.replay(store)
+    return store, journal
+
+
+# Write the segments to path. Written to the file the journal is based on, the journal
+# starts over since everything in it is now part of the file
+def save_project(store, path, journal=None):
+    write_segmentations(store.to_dataframe(), path)
+    if journal is not None and os.path.abspath(path) == os.path.abspath(journal.base):
+        journal.reset()
@@ -0,0 +1,163 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import Counter
+
+from peak_cache import CACHE_DIR
+
+# File headers and the labels of every file of the project, kept in SQLite so opening
+# a project and filtering the file list are queries instead of scans. Everything in it
+# can be rebuilt from the audiofiles and the segments, it lives with the other caches
+INDEX_FILE = os.path.join(CACHE_DIR, 'project.sqlite')
+
+# Bump when the tables change, older indexes are dropped and rebuilt
+SCHEMA_VERSION = 3
+
+# A directory modified this recently may still change within the same mtime, e.g. on
+# filesystems with coarse timestamps, it is listed again on the next scan
+DIRECTORY_SETTLE = 2
+
+INFO_KEYS = ('path', 'format', 'f_rate', 'n_channels', 'samp_width', 'n_frames', 'offset', 'duration')
+
+# Files and directories are keyed by their path relative to the project root, labels by
+# filename like the segments
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY,
+    filename TEXT,
+    size INTEGER,
+    mtime INTEGER,
+    path TEXT, format, f_rate INTEGER, n_channels INTEGER, samp_width INTEGER,
+    n_frames INTEGER, offset INTEGER, duration REAL);
+CREATE TABLE IF NOT EXISTS labels (
+    label TEXT,
+    filename TEXT,
+    count INTEGER,
+    PRIMARY KEY (label, filename));
+CREATE INDEX IF NOT EXISTS labels_filename ON labels (filename);
+CREATE INDEX IF NOT EXISTS files_filename ON files (filename);
+CREATE TABLE IF NOT EXISTS directories (
+    key TEXT PRIMARY KEY,
+    mtime INTEGER);
+"""
+
+
+# Size and modification time a file is indexed with, None when it is gone
+def file_stamp(path):
+    try: stat = os.stat(path)
+    except OSError: return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ProjectIndex:
+    def __init__(self, path=INDEX_FILE, root='.'):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.root = os.path.abspath(root)
+
+        # Written by the scan thread and queried by the GUI, one connection used under a lock
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+
+        # The index is a cache, a crash may lose the last updates but never corrupts it
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=OFF")
+
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS labels; DROP TABLE IF EXISTS directories;")
+            self.db.execute("PRAGMA user_version=%d" % SCHEMA_VERSION)
+        self.db.executescript(SCHEMA)
+
+    # Key of a file or directory, its path relative to the project root
+    def relative(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    # Indexed files as key -> ((size, mtime), info)
+    def files(self):
+        with self.lock:
+            rows = self.db.execute("SELECT key, size, mtime, %s FROM files" % ", ".join(INFO_KEYS)).fetchall()
+        return {row[0] : ((row[1], row[2]), dict(zip(INFO_KEYS, row[3:]))) for row in rows}
+
+    # Store headers as (key, stamp, info), all in one transaction
+    def put_files(self, rows):
+        if len(rows) == 0:
+            return
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, %s)" % ", ".join("?" * len(INFO_KEYS)),
+                                [(key, os.path.basename(key), stamp[0], stamp[1]) + tuple(info[name] for name in INFO_KEYS)
+                                 for key, stamp, info in rows])
+
+    def remove_files(self, keys):
+        if len(keys) == 0:
+            return
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM files WHERE key = ?", [(key,) for key in keys])
+
+    # Modification times of the directories whose files are all indexed, as key -> mtime.
+    # None for directories which have to be listed again
+    def directories(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT key, mtime FROM directories"))
+
+    # Store directories as (key, mtime). A directory modified within the last seconds is
+    # stored without a time, so it is listed again
+    def put_directories(self, rows):
+        if len(rows) == 0:
+            return
+        settled = time.time_ns() - DIRECTORY_SETTLE * 10 ** 9
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?)",
+                                [(key, mtime if mtime is not None and mtime < settled else None) for key, mtime in rows])
+
+    def remove_directories(self, keys):
+        if len(keys) == 0:
+            return
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM directories WHERE key = ?", [(key,) for key in keys])
+
+    # Replace the label counts of one file by those of its segments, called after every edit
+    def set_segments(self, filename, intervals):
+        with self.lock, self.db:
+            self.write_labels(filename, Counter(intervals.labels))
+
+    def write_labels(self, filename, counts):
+        self.db.execute("DELETE FROM labels WHERE filename = ?", (filename,))
+        self.db.executemany("INSERT INTO labels VALUES (?, ?, ?)", [(label, filename, count) for label, count in counts.items()])
+
+    # Bring the label counts in line with a store, only files whose counts changed are written
+    def sync_segments(self, store):
+        counts = {filename : Counter(intervals.labels) for filename, intervals in store.files.items() if len(intervals) > 0}
+        with self.lock, self.db:
+            indexed = {}
+            for label, filename, count in self.db.execute("SELECT label, filename, count FROM labels"):
+                indexed.setdefault(filename, Counter())[label] = count
+
+            for filename in set(indexed) - set(counts):
+                self.db.execute("DELETE FROM labels WHERE filename = ?", (filename,))
+            for filename, labels in counts.items():
+                if indexed.get(filename) != labels:
+                    self.write_labels(filename, labels)
+
+    # Files without any segment
+    def unlabeled(self):
+        with self.lock:
+            rows = self.db.execute("SELECT filename FROM files WHERE filename NOT IN (SELECT filename FROM labels)")
+            return set(filename for filename, in rows)
+
+    def labeled(self):
+        with self.lock:
+            return set(filename for filename, in self.db.execute("SELECT DISTINCT filename FROM labels"))
+
+    # Files with at least one segment of label
+    def with_label(self, label):
+        with self.lock:
+            return set(filename for filename, in self.db.execute("SELECT filename FROM labels WHERE label = ?", (label,)))
+
+    # Number of segments of every file that has any
+    def segment_counts(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT filename, SUM(count) FROM labels GROUP BY filename"))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,189 @@
+import os
+import queue
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from audio import read_audio_info, open_signal, audio_extensions
+from peaks import build_pyramid
+from project_index import file_stamp
+
+AUDIO_EXTENSIONS = audio_extensions()
+
+# Header reads are latency bound (network drives), so there are more workers than cores
+WORKERS = min(32, 4 * (os.cpu_count() or 1))
+
+# Seconds between checks for cancellation while waiting for headers or peaks
+CANCEL_INTERVAL = 0.1
+
+
+# Header of one file from the cache or the file itself, runs on a thread of the pool
+def load_header(path, cache=None):
+    info = cache.get_info(path) if cache is not None else None
+    if info is None:
+        info = read_audio_info(path)
+        if cache is not None:
+            cache.put_info(path, info)
+    return info, cache is not None and cache.has_peaks(path)
+
+
+# Peaks of one file, runs in a separate process since the reduction is CPU bound
+def load_peaks(info):
+    return info, build_pyramid(open_signal(info))
+
+
+# Yield (filename, info) for every audiofile in directory as soon as its header is read.
+# The tree is listed one directory at a time and headers are read while it is listed.
+# With peak_workers the peaks of files missing from the cache are built eagerly and
+# stored in the cache once all headers are read. With a project index, files which did
+# not change since they were indexed are yielded straight away, only new and changed
+# files are read, and the index is brought up to date. Directories whose modification
+# time did not change are not listed, their files are taken from the index and only
+# those whose size or modification time changed are read again. The scan stops once
+# cancelled returns True, also while it waits for headers or peaks between two files
+def scan_audio(directory, workers=WORKERS, cache=None, peak_workers=0, index=None, cancelled=None):
+    headers = ThreadPoolExecutor(max_workers=max(1, workers))
+    # Forking a process with running threads (pool, GUI) may deadlock the child
+    peaks = ProcessPoolExecutor(max_workers=peak_workers, mp_context=multiprocessing.get_context("spawn")) \
+        if peak_workers > 0 and cache is not None else None
+
+    key = index.relative if index is not None else os.path.abspath
+    indexed = index.files() if index is not None else {}
+    indexed_directories = index.directories() if index is not None else {}
+
+    # Indexed files and subdirectories of every directory, as directory -> ([files], [directories])
+    children = {}
+    for i, keys in enumerate((indexed, indexed_directories)):
+        for child in keys:
+            children.setdefault(os.path.dirname(child) or '.', ([], []))[i].append(child)
+
+    seen, seen_directories = set(), set()
+    updated = []
+    # Directories listed in full, stored with their modification time unless a header of
+    # one of their files could not be read. Subdirectories found are stored without a
+    # time, so a directory is never skipped while one below it was not listed yet
+    listed, found, incomplete = [], [], set()
+
+    # Header reads put themselves here when done, collected between listed files
+    futures = {}
+    done = queue.Queue()
+    peak_jobs = []
+
+    def finished(future):
+        path, file_key, stamp, directory_key = futures.pop(future)
+        try: info, has_peaks = future.result()
+        except Exception as e:
+            print(path + ": " + str(e))
+            incomplete.add(directory_key)
+            return None
+
+        updated.append((file_key, stamp, info))
+        if peaks is not None and not has_peaks:
+            peak_jobs.append(peaks.submit(load_peaks, info))
+        return os.path.basename(path), info
+
+    def indexed_file(path, info):
+        if peaks is not None and not cache.has_peaks(path):
+            peak_jobs.append(peaks.submit(load_peaks, info))
+        return os.path.basename(path), info
+
+    try:
+        directories = [directory]
+        while directories:
+            path = directories.pop()
+            directory_key = key(path)
+            try: mtime = os.stat(path).st_mtime_ns
+            except OSError: continue
+            seen_directories.add(directory_key)
+
+            # The files of an unchanged directory are still checked one by one, a file
+            # rewritten in place does not change the directory
+            files, subdirectories = children.get(directory_key, ([], []))
+            if indexed_directories.get(directory_key) == mtime and \
+               all(indexed[file_key][1]['path'] == os.path.join(path, os.path.basename(file_key)) for file_key in files):
+                for file_key in files:
+                    file_path = os.path.join(path, os.path.basename(file_key))
+                    stamp = file_stamp(file_path)
+                    if stamp is None:
+                        continue
+                    seen.add(file_key)
+                    if stamp == indexed[file_key][0]:
+                        yield indexed_file(file_path, indexed[file_key][1])
+                    else:
+                        future = headers.submit(load_header, file_path, cache)
+                        futures[future] = (file_path, file_key, stamp, directory_key)
+                        future.add_done_callback(done.put)
+                directories.extend(os.path.join(path, os.path.basename(child)) for child in subdirectories)
+                listed.append((directory_key, mtime))
+                continue
+
+            try: entries = list(os.scandir(path))
+            except OSError: continue
+            for entry in entries:
+                try: is_dir = entry.is_dir()
+                except OSError: continue
+                if is_dir:
+                    directories.append(entry.path)
+                    found.append(key(entry.path))
+                elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                    file_key = key(entry.path)
+                    seen.add(file_key)
+                    stamp = file_stamp(entry.path)
+                    if file_key in indexed and indexed[file_key][0] == stamp and indexed[file_key][1]['path'] == entry.path:
+                        yield indexed_file(entry.path, indexed[file_key][1])
+                    else:
+                        future = headers.submit(load_header, entry.path, cache)
+                        futures[future] = (entry.path, file_key, stamp, directory_key)
+                        future.add_done_callback(done.put)
+
+                while not done.empty():
+                    result = finished(done.get())
+                    if result is not None:
+                        yield result
+            listed.append((directory_key, mtime))
+
+        while futures:
+            try: future = done.get(timeout=CANCEL_INTERVAL)
+            except queue.Empty:
+                if cancelled is not None and cancelled():
+                    return
+                continue
+            result = finished(future)
+            if result is not None:
+                yield result
+
+        # Only a complete listing tells which files are gone
+        if index is not None:
+            index.remove_files(set(indexed) - seen)
+            index.remove_directories(set(indexed_directories) - seen_directories)
+
+        pending = set(peak_jobs)
+        while pending:
+            if cancelled is not None and cancelled():
+                return
+            completed, pending = wait(pending, timeout=CANCEL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in completed:
+                try: info, pyramid = future.result()
+                except Exception as e:
+                    print(e)
+                    continue
+                cache.put_peaks(info['path'], pyramid)
+
+    # Pending work is dropped when the caller stops iterating early, the headers read
+    # so far are kept in the index
+    finally:
+        if index is not None:
+            index.put_files(updated)
+            incomplete.update(directory_key for path, file_key, stamp, directory_key in futures.values())
+            index.put_directories([(directory_key, None) for directory_key in found] +
+                                  [(directory_key, None if directory_key in incomplete else mtime) for directory_key, mtime in listed])
+        for future in futures:
+            future.cancel()
+        headers.shutdown(wait=False)
+        if peaks is not None:
+            # Peaks being built are not waited for, the interpreter would join the workers
+            # on exit. The executor has no public way to stop them before Python 3.14, its
+            # futures fail with BrokenProcessPool (cancelling them first trips the executor)
+            if not all(future.done() for future in peak_jobs):
+                for process in list((getattr(peaks, '_processes', None) or {}).values()):
+                    process.terminate()
+            peaks.shutdown(wait=False)
@@ -0,0 +1,86 @@
+import os
+
+from segments import COLUMNS
+
+# Segmentation file backends, picked from the file extension. xlsx is kept for
+# existing projects but is by far the slowest to read and write
+FORMATS = ('.parquet', '.feather', '.csv', '.xlsx')
+
+# Typed columns for the columnar backends
+DTYPES = {'filename' : 'category', 'label' : 'category', 'start' : 'float32', 'stop' : 'float32'}
+
+# Rows per chunk when a file is read in chunks, parquet is read a row group at a time
+CHUNK_ROWS = 1 << 20
+
+
+def segmentation_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError("Unsupported segmentation file " + path + ", use one of " + ", ".join(FORMATS))
+    return ext
+
+
+def read_segmentations(path):
+    import pandas as pd
+    ext = segmentation_format(path)
+
+    if ext == '.parquet':
+        df = pd.read_parquet(path)
+    elif ext == '.feather':
+        df = pd.read_feather(path)
+    elif ext == '.csv':
+        df = pd.read_csv(path, dtype=DTYPES)
+    else:
+        return pd.read_excel(path)
+    return normalize(df)
+
+
+# Read a segmentation file in chunks of about chunk_rows rows, for files that are only
+# passed over once. xlsx cannot be read in parts and comes in one chunk
+def iter_segmentations(path, chunk_rows=CHUNK_ROWS):
+    import pandas as pd
+    ext = segmentation_format(path)
+
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=COLUMNS):
+            yield normalize(batch.to_pandas())
+    elif ext == '.feather':
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield normalize(reader.get_batch(i).to_pandas())
+    elif ext == '.csv':
+        with pd.read_csv(path, dtype=DTYPES, chunksize=chunk_rows) as reader:
+            for df in reader:
+                yield normalize(df)
+    else:
+        yield pd.read_excel(path)
+
+
+# Times are stored as float32, round them back to the 10 ms resolution used when labeling
+def normalize(df):
+    df = df.astype({'filename' : str, 'label' : str})
+    df['start'] = df['start'].astype('float64').round(2)
+    df['stop'] = df['stop'].astype('float64').round(2)
+    return df[COLUMNS]
+
+
+# Written next to the target and renamed, so a crash never leaves a half-written file
+def write_segmentations(df, path):
+    ext = segmentation_format(path)
+    tmp = os.path.splitext(path)[0] + '.tmp' + ext
+
+    if ext == '.xlsx':
+        df.to_excel(tmp, index=False)
+    else:
+        df = df[COLUMNS].astype(DTYPES)
+        if ext == '.parquet':
+            df.to_parquet(tmp, index=False)
+        elif ext == '.feather':
+            df.reset_index(drop=True).to_feather(tmp)
+        else:
+            df.to_csv(tmp, index=False)
+
+    os.replace(tmp, path)
@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import numpy as np
+
+COLUMNS = ["filename", "label", "start", "stop"]
+
+
+# Segments of a single file, sorted by start time and stored in parallel arrays
+class IntervalList:
+    def __init__(self, labels=(), starts=(), stops=()):
+        self.labels = list(labels)
+        self.starts = array('d', starts)
+        self.stops = array('d', stops)
+
+        # NumPy copy of the arrays used for hit testing, rebuilt after mutations
+        self.index = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        return self.labels[idx], self.starts[idx], self.stops[idx]
+
+    def __iter__(self):
+        return zip(self.labels, self.starts, self.stops)
+
+    # Row a segment starting at start is inserted at, after segments with the same start
+    def position(self, start):
+        return bisect_right(self.starts, start)
+
+    # Insert a segment and return its row
+    def insert(self, label, start, stop):
+        idx = self.position(start)
+        self.labels.insert(idx, label)
+        self.starts.insert(idx, start)
+        self.stops.insert(idx, stop)
+        self.index = None
+        return idx
+
+    # Merge a batch of segments in one pass and return their rows. Like insert, new
+    # segments go after existing segments with the same start
+    def extend(self, labels, starts, stops):
+        order = np.argsort(np.asarray(starts, dtype=float), kind='stable')
+        new_starts = np.asarray(starts, dtype=float)[order]
+        rows = np.searchsorted(np.array(self.starts), new_starts, side='right') + np.arange(len(order))
+
+        is_new = np.zeros(len(self) + len(order), dtype=bool)
+        is_new[rows] = True
+        merged_starts = np.empty(len(is_new))
+        merged_starts[is_new] = new_starts
+        merged_starts[~is_new] = self.starts
+        merged_stops = np.empty(len(is_new))
+        merged_stops[is_new] = np.asarray(stops, dtype=float)[order]
+        merged_stops[~is_new] = self.stops
+        merged_labels = np.empty(len(is_new), dtype=object)
+        merged_labels[is_new] = [labels[idx] for idx in order]
+        merged_labels[~is_new] = self.labels
+
+        self.labels = merged_labels.tolist()
+        self.starts = array('d', merged_starts.tolist())
+        self.stops = array('d', merged_stops.tolist())
+        self.index = None
+
+        # Rows in the order the segments were passed
+        placed = np.empty(len(order), dtype=int)
+        placed[order] = rows
+        return placed.tolist()
+
+    # Row of a segment with exactly these values, None when there is none
+    def find(self, label, start, stop):
+        idx = bisect_left(self.starts, start)
+        while idx < len(self) and self.starts[idx] == start:
+            if self.labels[idx] == label and self.stops[idx] == stop:
+                return idx
+            idx += 1
+        return None
+
+    def pop(self, idx):
+        segment = self[idx]
+        del self.labels[idx]
+        del self.starts[idx]
+        del self.stops[idx]
+        self.index = None
+        return segment
+
+    # Rows of all segments containing t. Segments starting after t are cut off with a
+    # searchsorted on the starts, segments ending before t with one on the running
+    # maximum of the stops, so only the remaining window is compared
+    def hits(self, t):
+        if self.index is None:
+            stops = np.array(self.stops)
+            self.index = (np.array(self.starts), stops, np.maximum.accumulate(stops))
+        starts, stops, reach = self.index
+
+        first = np.searchsorted(reach, t, side='left')
+        last = np.searchsorted(starts, t, side='right')
+        return (first + np.nonzero(stops[first:last] >= t)[0]).tolist()
+
+
+# All segments of a project, indexed by filename
+class SegmentStore:
+    def __init__(self):
+        self.files = {}
+
+    def __len__(self):
+        return sum(len(intervals) for intervals in self.files.values())
+
+    # Segments of a file, empty when the file has none
+    def segments(self, filename):
+        return self.files.get(filename, IntervalList())
+
+    def add(self, filename, label, start, stop):
+        if filename not in self.files:
+            self.files[filename] = IntervalList()
+        return self.files[filename].insert(label, start, stop)
+
+    def extend(self, filename, labels, starts, stops):
+        if filename not in self.files:
+            self.files[filename] = IntervalList()
+        return self.files[filename].extend(labels, starts, stops)
+
+    def remove(self, filename, idx):
+        return self.files[filename].pop(idx)
+
+    # Remove a segment by value, used when the row is not known
+    def discard(self, filename, label, start, stop):
+        idx = self.segments(filename).find(label, start, stop)
+        if idx is not None:
+            self.remove(filename, idx)
+        return idx
+
+    # Rows ordered by filename and start time, the layout of the exported file
+    def records(self):
+        for filename in sorted(self.files):
+            for label, start, stop in self.files[filename]:
+                yield filename, label, start, stop
+
+    # The DataFrame is only built when the segments are written to disk
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(list(self.records()), columns=COLUMNS)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        store = cls()
+        df = df.sort_values(['filename', 'start'], kind='mergesort')
+        for filename, group in df.groupby('filename', sort=False):
+            store.files[filename] = IntervalList(group['label'], group['start'].astype(float), group['stop'].astype(float))
+        return store
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+import numpy as np
+
+# Samples per STFT frame
+N_FFT = 512
+
+# Frames per cached tile, tiles are computed and evicted as a whole
+TILE_FRAMES = 256
+
+# Frames are never spaced closer than this many samples, deep zooms show fewer, wider frames
+MIN_HOP = 64
+
+# Memory used by cached tiles, least recently used tiles are dropped first
+CACHE_BYTES = 64 * 1024 * 1024
+
+# Lower end of the color scale, in dB below full scale
+DB_FLOOR = -100
+
+WINDOW = np.hanning(N_FFT).astype(np.float32)
+
+
+# Power in dB relative to a full scale sine, one column per frame
+def stft_db(block):
+    block -= block.mean(axis=1, keepdims=True)
+    spectrum = np.abs(np.fft.rfft(block * WINDOW, axis=1)) / (WINDOW.sum() / 2)
+    return (20 * np.log10(np.maximum(spectrum, 1e-10))).T.astype(np.float32)
+
+
+# Frames are spaced by the smallest power of two covering a screen pixel, so tiles
+# are shared between nearby zoom levels
+def hop_for(samples_per_pixel):
+    return max(MIN_HOP, 1 << int(np.ceil(np.log2(max(1, samples_per_pixel)))))
+
+
+# Spectrogram tiles keyed by file, hop and tile number. Only the tiles of the windows
+# that were looked at are computed, the full-file spectrogram is never held in memory
+class SpectrogramCache:
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.size = 0
+
+    def tile(self, filename, signal, hop, idx, total):
+        key = (filename, hop, idx)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+
+        first = idx * TILE_FRAMES
+
+        # Only the samples inside the frames are read when frames are further apart than N_FFT
+        tile = stft_db(signal.frames(first * hop, hop, min(TILE_FRAMES, total - first), N_FFT))
+        self.tiles[key] = tile
+        self.size += tile.nbytes
+        while self.size > self.max_bytes and len(self.tiles) > 1:
+            self.size -= self.tiles.popitem(last=False)[1].nbytes
+        return tile
+
+    # Spectrogram of t0 to t1 seconds at about one frame per pixel. Returns the image
+    # (frequency x time) with the times of its first and last edge, None if the window is empty
+    def view(self, filename, signal, f_rate, t0, t1, width):
+        hop = hop_for((t1 - t0) * f_rate / max(width, 1))
+        total = -(-len(signal) // hop)
+        f0 = max(0, int(t0 * f_rate) // hop)
+        f1 = min(total, int(np.ceil(t1 * f_rate / hop)))
+        if f1 <= f0:
+            return None
+
+        first_tile = f0 // TILE_FRAMES
+        tiles = [self.tile(filename, signal, hop, idx, total) for idx in range(first_tile, (f1 - 1) // TILE_FRAMES + 1)]
+        offset = first_tile * TILE_FRAMES
+        image = np.hstack(tiles)[:, f0 - offset:f1 - offset]
+        return image, f0 * hop / f_rate, f1 * hop / f_rate
@@ -0,0 +1,124 @@
+import os
+import json
+
+import pandas as pd
+import pytest
+
+from journal import Journal
+from project import journal_path, open_project, save_project
+from segmentation_file import write_segmentations
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = 'segmentations.parquet'
+    write_segmentations(pd.DataFrame({'filename' : ['a.wav'], 'label' : ['speech'], 'start' : [1.0], 'stop' : [2.0]}), path)
+    return path
+
+
+def segments(store):
+    return list(store.records())
+
+
+def test_replay_applies_unexported_edits(project):
+    store, journal = open_project(project)
+    journal.add('a.wav', 'music', 3.0, 4.0)
+    journal.delete('a.wav', 'speech', 1.0, 2.0)
+    journal.close()
+
+    store, journal = open_project(project)
+    journal.close()
+    assert segments(store) == [('a.wav', 'music', 3.0, 4.0)]
+    assert journal.stale is None
+
+
+def test_torn_last_line_is_ignored(project):
+    store, journal = open_project(project)
+    journal.add('a.wav', 'music', 3.0, 4.0)
+    journal.close()
+    with open(journal_path(project), 'a') as f:
+        f.write('{"op" : "add", "filename" : "a.w')
+
+    # Records appended after the torn line are replayed too
+    store, journal = open_project(project)
+    journal.add('a.wav', 'noise', 5.0, 6.0)
+    journal.close()
+    store, journal = open_project(project)
+    journal.close()
+    assert segments(store) == [('a.wav', 'speech', 1.0, 2.0), ('a.wav', 'music', 3.0, 4.0), ('a.wav', 'noise', 5.0, 6.0)]
+
+
+# The file was written but the journal not reset: its edits are in the file and must
+# neither be applied twice nor be kept as stale
+def test_crash_between_export_and_reset(project, monkeypatch):
+    store, journal = open_project(project)
+    store.add('a.wav', 'music', 3.0, 4.0)
+    journal.add('a.wav', 'music', 3.0, 4.0)
+    store.discard('a.wav', 'speech', 1.0, 2.0)
+    journal.delete('a.wav', 'speech', 1.0, 2.0)
+    journal.flush()
+    with monkeypatch.context() as patch:
+        patch.setattr(Journal, 'reset', lambda self: None)
+        save_project(store, project, journal)
+    journal.close()
+
+    store, journal = open_project(project)
+    journal.close()
+    assert segments(store) == [('a.wav', 'music', 3.0, 4.0)]
+    assert journal.stale is None
+    assert not any(name.endswith('.stale') for name in os.listdir('.'))
+
+
+# Copying the project or a checkout changes the stamp, the edits are not in the file
+def test_mismatch_keeps_journal_aside(project):
+    store, journal = open_project(project)
+    journal.add('a.wav', 'music', 3.0, 4.0)
+    journal.close()
+    with open(journal_path(project)) as f:
+        recorded = f.read()
+    stat = os.stat(project)
+    os.utime(project, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    store, journal = open_project(project)
+    journal.close()
+    assert segments(store) == [('a.wav', 'speech', 1.0, 2.0)]
+    assert journal.stale == journal_path(project) + '.stale'
+    with open(journal.stale) as f:
+        assert f.read() == recorded
+
+    # A second stale journal does not replace the first
+    store, journal = open_project(project)
+    journal.add('a.wav', 'noise', 5.0, 6.0)
+    journal.close()
+    os.utime(project, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    store, journal = open_project(project)
+    journal.close()
+    assert journal.stale == journal_path(project) + '.stale.1'
+
+
+def test_journal_per_segmentation_file(project):
+    write_segmentations(pd.DataFrame({'filename' : ['b.wav'], 'label' : ['speech'], 'start' : [1.0], 'stop' : [2.0]}),
+                        'segmentations.xlsx')
+    store, journal = open_project(project)
+    journal.add('a.wav', 'music', 3.0, 4.0)
+    journal.close()
+
+    store, journal = open_project('segmentations.xlsx')
+    journal.close()
+    store, journal = open_project(project)
+    journal.close()
+    assert journal_path(project) != journal_path('segmentations.xlsx')
+    assert ('a.wav', 'music', 3.0, 4.0) in segments(store)
+
+
+def test_legacy_journal_is_taken_over(project):
+    stat = os.stat(project)
+    with open('segmentations.journal', 'w') as f:
+        f.write(json.dumps({'op' : 'base', 'stamp' : [stat.st_size, stat.st_mtime_ns]}) + '\n')
+        f.write(json.dumps({'op' : 'add', 'filename' : 'a.wav', 'label' : 'music', 'start' : 3.0, 'stop' : 4.0}) + '\n')
+
+    store, journal = open_project(project)
+    journal.close()
+    assert ('a.wav', 'music', 3.0, 4.0) in segments(store)
+    assert not os.path.exists('segmentations.journal')